@@ -4,8 +4,11 @@ from aioesphomeapi.core import (
 )
 
 from .basic_entity import *
+from .filters import *
+from .runtime import *
 from .binary_sensor import *
 from .device import *
+from .device_host import *
 from .listener import *
 from .native_api_server import *
 from .switch import *
@@ -13,3 +16,4 @@ from .web_server import *
 from .light import *
 from .sensor import *
 from .climate import *
+from .supervisor import *
@@ -1,10 +1,51 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import math
 import re
 import hashlib
+from types import ModuleType
+from typing import ClassVar
+
+from aiohttp import web
+from google.protobuf.message import Message
+
+from .rate_limit import PublishLimiter
+
+orjson: ModuleType | None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+MAX_LONG_POLL = 60.0
 
 class BasicEntity:
     DOMAIN = ""
+    COMMAND_TYPES: ClassVar[tuple[type[Message], ...]] = ()
+
+    __slots__ = (
+        "name",
+        "_assigned_object_id",
+        "_assigned_unique_id",
+        "icon",
+        "device_class",
+        "entity_category",
+        "device",
+        "key",
+        "_state",
+        "state_version",
+        "_state_waiters",
+        "_state_json",
+        "_state_json_version",
+        "_limiter",
+    )
 
     def __init__(
             self,
@@ -14,6 +55,8 @@ class BasicEntity:
             icon=None,
             device_class=None,
             entity_category=None,
+            min_interval=None,
+            max_interval=None,
     ):
         self.name = name
         self._assigned_object_id = object_id
@@ -26,6 +69,14 @@ class BasicEntity:
         self.key = None
 
         self._state = False
+        self.state_version = 0
+        self._state_waiters = None
+        self._state_json = None
+        self._state_json_version = None
+
+        self._limiter = None
+        if min_interval or max_interval:
+            self._limiter = PublishLimiter(min_interval, max_interval)
 
     def set_device(self, device):
         self.device = device
@@ -68,21 +119,154 @@ class BasicEntity:
     async def build_state_response(self):
         pass
 
-    async def state_json(self):
+    async def build_state_json(self):
         pass
 
+    async def state_json(self):
+        # The encoded document is reused until the next state change
+        if self._state_json_version != self.state_version:
+            data = await self.build_state_json()
+            self._state_json = None if data is None else _dumps(data)
+            self._state_json_version = self.state_version
+        return self._state_json
+
+    def subscriptions(self):
+        # Each subscription is a (key, message_type, entity_key) tuple where
+        # None matches anything. Entities that don't implement handle() don't
+        # need any messages and commands for COMMAND_TYPES are routed directly,
+        # custom handlers get everything unless narrowed.
+        handle = type(self).handle
+        if handle is BasicEntity.handle:
+            return []
+        for klass in type(self).__mro__:
+            if "COMMAND_TYPES" in vars(klass):
+                # A subclass overriding the command handler still sees everything
+                if handle is klass.handle and self.COMMAND_TYPES:
+                    return []
+                break
+        return [(None, None, None)]
+
     async def can_handle(self, key, message):
         return True
 
     async def handle(self, key, message):
         pass
 
+    async def handle_command(self, message):
+        await self.handle('client_request', message)
+
+    async def handle_web_command(self, action, params):
+        raise ValueError(f"{self.DOMAIN or 'entity'} does not support '{action}'")
+
     async def add_routes(self, router):
         pass
 
+    def bump_state_version(self):
+        self.state_version += 1
+        if self._state_waiters:
+            for waiter in self._state_waiters:
+                if not waiter.done():
+                    waiter.set_result(self.state_version)
+            self._state_waiters = None
+
+    async def wait_for_state_change(self, version, timeout):
+        if self.state_version != version:
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        if self._state_waiters is None:
+            self._state_waiters = []
+        self._state_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._state_waiters and waiter in self._state_waiters:
+                self._state_waiters.remove(waiter)
+
+    @property
+    def state_etag(self):
+        return f'"{self.device.boot_id}-{self.state_version}"'
+
+    async def route_get_state(self, request):
+        # Pollers that already have the current version get a 304 without the
+        # state being rendered, or wait for the next change with ?wait=seconds.
+        version = self.state_version
+        known = (
+            request.headers.get("If-None-Match") == self.state_etag
+            or request.query.get("version") == str(version)
+        )
+
+        timeout = None
+        if "wait" in request.query:
+            try:
+                timeout = float(request.query["wait"])
+            except ValueError:
+                timeout = math.nan
+            if math.isnan(timeout):
+                raise web.HTTPBadRequest(text="wait must be a number of seconds")
+            timeout = min(max(timeout, 0.0), MAX_LONG_POLL)
+
+        if known and timeout:
+            await self.wait_for_state_change(version, timeout)
+            known = self.state_version == version
+
+        headers = {"ETag": self.state_etag, "X-State-Version": str(self.state_version)}
+        if known:
+            return web.Response(status=304, headers=headers)
+
+        data = await self.state_json()
+        return web.Response(text=data, headers=headers)
+
+    def metadata_changed(self):
+        # Call after changing anything build_list_entities_response reads,
+        # the encoded ListEntities responses are cached by the device
+        if self.device is not None:
+            self.device.invalidate_list_entities()
+
+    def set_deadband(self, deadband=None, deadband_percent=None):
+        if deadband is None and deadband_percent is None:
+            return
+        if self._limiter is None:
+            self._limiter = PublishLimiter()
+        self._limiter.deadband = deadband
+        self._limiter.deadband_percent = deadband_percent
+
+    def deadband_value(self):
+        # Numeric entities return the value their deadband applies to
+        return None
+
+    def in_deadband(self, value):
+        return self._limiter is not None and self._limiter.in_deadband(value)
+
+    def suppress_state_change(self):
+        # The new state is still served to send_all_states and the web
+        # routes, it just isn't pushed to subscribers.
+        self.bump_state_version()
+        self.device.state_snapshot.invalidate(self)
+
+    def cancel_pending_publish(self):
+        if self._limiter is not None:
+            self._limiter.cancel()
+
     async def notify_state_change(self):
+        if self._limiter is not None and self._limiter.hold(self):
+            self.suppress_state_change()
+            return
+
+        self.bump_state_version()
+        await self.publish_state_change()
+
+    async def publish_state_change(self):
+        message = await self.build_state_response()
+        self.device.state_snapshot.update(self, message)
+        if self._limiter is not None:
+            self._limiter.published(self)
+        if self.device.defer_state_change(self, message):
+            return
         await self.device.publish(
             self,
             'state_change',
-            await self.build_state_response()
+            message
         )
\ No newline at end of file
@@ -1,5 +1,3 @@
-import asyncio
-
 from . import (
     BinarySensorEntity,
     Device,
@@ -10,6 +8,7 @@ from . import (
     WebServer,
     LightEntity,
     SensorEntity,
+    LOW_LATENCY_RUNTIME_PROFILE,
 )
 
 from aioesphomeapi import LightColorCapability
@@ -62,4 +61,5 @@ if __name__ == "__main__":
         )
     )
 
-    asyncio.run(device.run())
+    profile = LOW_LATENCY_RUNTIME_PROFILE
+    profile.run(device.run(6053, 8080, runtime_profile=profile))
@@ -1,19 +1,22 @@
 from __future__ import annotations
 
-import json
-
 from . import (
     BasicEntity,
     BinarySensorStateResponse,
+    FilterChain,
     ListEntitiesBinarySensorResponse,
 )
 
 class BinarySensorEntity(BasicEntity):
     DOMAIN = "binary_sensor"
-    
-    def __init__(self, *args, **kwargs):
+
+    __slots__ = ("_raw_state", "_filters")
+
+    def __init__(self, *args, filters=None, **kwargs):
         super().__init__(*args, **kwargs)
         self._state = False
+        self._raw_state = False
+        self._filters = FilterChain(filters, self.publish_state) if filters else None
 
     async def build_list_entities_response(self):
         return ListEntitiesBinarySensorResponse(
@@ -32,7 +35,7 @@ class BinarySensorEntity(BasicEntity):
             state = await self.get_state()
         )
 
-    async def state_json(self):
+    async def build_state_json(self):
         state = await self.get_state()
         state_str = "ON" if state else "OFF"
 
@@ -42,12 +45,24 @@ class BinarySensorEntity(BasicEntity):
             "state": state_str,
             "value": state,
         }
-        return json.dumps(data)
+        return data
+
+    @property
+    def raw_state(self):
+        return self._raw_state if self._filters is not None else self._state
 
     async def get_state(self):
         return self._state
 
     async def set_state(self, val):
+        if self._filters is not None:
+            self._raw_state = val
+            val = self._filters.push(val)
+            if val is None:
+                return
+        await self.publish_state(val)
+
+    async def publish_state(self, val):
         old_state = self._state
         self._state = val
         if val != old_state:
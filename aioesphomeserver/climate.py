@@ -1,7 +1,6 @@
 from . import BasicEntity, ListEntitiesClimateResponse, ClimateStateResponse, ClimateCommandRequest
 from aiohttp import web
 import logging
-import json
 from aioesphomeapi import (
     ClimateMode,
     ClimateFanMode,
@@ -12,8 +11,50 @@ from aioesphomeapi import (
 
 logger = logging.getLogger(__name__)
 
+_MODE_NAMES = {m.value: m.name for m in ClimateMode}
+_FAN_MODE_NAMES = {m.value: m.name for m in ClimateFanMode}
+_SWING_MODE_NAMES = {m.value: m.name for m in ClimateSwingMode}
+_ACTION_NAMES = {m.value: m.name for m in ClimateAction}
+_PRESET_NAMES = {m.value: m.name for m in ClimatePreset}
+
+def _enum_name(names, value):
+    # Unset fields go out as the protobuf default, like the state response
+    return names[value or 0]
+
 class ClimateEntity(BasicEntity):
     DOMAIN = "climate"
+    COMMAND_TYPES = (ClimateCommandRequest,)
+
+    __slots__ = (
+        "supported_modes",
+        "supports_two_point_target_temperature",
+        "visual_min_temperature",
+        "visual_max_temperature",
+        "visual_target_temperature_step",
+        "supports_fan_mode",
+        "supported_fan_modes",
+        "supports_swing_mode",
+        "supported_swing_modes",
+        "supports_action",
+        "supports_current_temperature",
+        "supports_current_humidity",
+        "supports_target_humidity",
+        "visual_min_humidity",
+        "visual_max_humidity",
+        "supports_preset",
+        "supported_presets",
+        "mode",
+        "target_temperature_low",
+        "target_temperature_high",
+        "target_temperature",
+        "current_temperature",
+        "fan_mode",
+        "swing_mode",
+        "action",
+        "preset",
+        "current_humidity",
+        "target_humidity",
+    )
 
     def __init__(self, *args, 
                  supported_modes=None,
@@ -33,6 +74,8 @@ class ClimateEntity(BasicEntity):
                  visual_max_humidity=100,
                  supports_preset=False,
                  supported_presets=None,
+                 deadband=None,
+                 deadband_percent=None,
                  **kwargs):
         super().__init__(*args, **kwargs)
         
@@ -67,6 +110,7 @@ class ClimateEntity(BasicEntity):
         self.preset = self.supported_presets[0] if self.supported_presets else None
         self.current_humidity = 0
         self.target_humidity = 0
+        self.set_deadband(deadband, deadband_percent)
 
         logger.info(f"ClimateEntity: {self.object_id} initialized with settings: "
                     f"supported_modes={self.supported_modes}, "
@@ -119,26 +163,25 @@ class ClimateEntity(BasicEntity):
             preset=self.preset,
         )
 
-    async def state_json(self):
-        state = await self.build_state_response()
+    async def build_state_json(self):
         data = {
             "id": self.json_id,
             "name": self.name,
-            "mode": ClimateMode(state.mode).name,
-            "current_temperature": state.current_temperature if self.supports_current_temperature else None,
-            "fan_mode": ClimateFanMode(state.fan_mode).name if self.supports_fan_mode and state.fan_mode is not None else None,
-            "swing_mode": ClimateSwingMode(state.swing_mode).name if self.supports_swing_mode and state.swing_mode is not None else None,
-            "action": ClimateAction(state.action).name if self.supports_action else None,
-            "preset": ClimatePreset(state.preset).name if self.supports_preset and state.preset is not None else None,
-            "current_humidity": state.current_humidity if self.supports_current_humidity else None,
-            "target_humidity": state.target_humidity if self.supports_target_humidity else None,
+            "mode": _enum_name(_MODE_NAMES, self.mode),
+            "current_temperature": float(self.current_temperature) if self.supports_current_temperature else None,
+            "fan_mode": _enum_name(_FAN_MODE_NAMES, self.fan_mode) if self.supports_fan_mode else None,
+            "swing_mode": _enum_name(_SWING_MODE_NAMES, self.swing_mode) if self.supports_swing_mode else None,
+            "action": _enum_name(_ACTION_NAMES, self.action) if self.supports_action else None,
+            "preset": _enum_name(_PRESET_NAMES, self.preset) if self.supports_preset else None,
+            "current_humidity": float(self.current_humidity) if self.supports_current_humidity else None,
+            "target_humidity": float(self.target_humidity) if self.supports_target_humidity else None,
         }
         if self.supports_two_point_target_temperature:
-            data["target_temperature_low"] = state.target_temperature_low
-            data["target_temperature_high"] = state.target_temperature_high
+            data["target_temperature_low"] = float(self.target_temperature_low)
+            data["target_temperature_high"] = float(self.target_temperature_high)
         else:
-            data["target_temperature"] = state.target_temperature
-        return json.dumps(data)
+            data["target_temperature"] = float(self.target_temperature)
+        return data
 
     async def set_state_from_command(self, command):
         changed = False
@@ -155,6 +198,19 @@ class ClimateEntity(BasicEntity):
         if changed:
             await self.notify_state_change()
 
+    def deadband_value(self):
+        return self.current_temperature
+
+    async def set_current_temperature(self, value):
+        if value == self.current_temperature:
+            return
+        self.current_temperature = value
+        # The deadband only applies to current_temperature, other changes always go out
+        if self.in_deadband(value):
+            self.suppress_state_change()
+            return
+        await self.notify_state_change()
+
     async def set_state_from_query(self, **query):
         cmd = ClimateCommandRequest(key=self.key)
 
@@ -192,6 +248,18 @@ class ClimateEntity(BasicEntity):
 
         await self.set_state_from_command(cmd)
 
+    async def handle(self, key, message):
+        if type(message) == ClimateCommandRequest:
+            if message.key == self.key:
+                await self.set_state_from_command(message)
+
+    async def handle_web_command(self, action, params):
+        if action != "set":
+            await super().handle_web_command(action, params)
+            return
+
+        await self.set_state_from_query(**params)
+
     async def add_routes(self, router):
         router.add_route("GET", f"/climate/{self.object_id}", self.route_get_state)
         router.add_route("POST", f"/climate/{self.object_id}/set", self.route_set_state)
@@ -210,10 +278,6 @@ class ClimateEntity(BasicEntity):
         if self.supports_target_humidity:
             router.add_route("POST", f"/climate/{self.object_id}/set_target_humidity", self.route_set_target_humidity)
 
-    async def route_get_state(self, request):
-        data = await self.state_json()
-        return web.Response(text=data)
-
     async def route_set_state(self, request):
         query = await request.json()
         await self.set_state_from_query(**query)
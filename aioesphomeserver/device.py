@@ -1,22 +1,53 @@
+from __future__ import annotations
+
 from . import (
     DeviceInfoRequest,
     DeviceInfoResponse,
+    ListEntitiesDoneResponse,
 )
 
-from .logger import format_log
+from .encryption import NOISE_PROTOCOL_NAME, decode_encryption_key
+from .framing import encode_plaintext_frames, message_to_packet
+from .state_snapshot import StateSnapshot
+from .state_store import SensorValueStore
+from .runtime import DEFAULT_RUNTIME_PROFILE
+from .scheduler import get_scheduler
 
-from inspect import getframeinfo, stack
+from .logger import (
+    LOG_LEVEL_DEBUG,
+    LOG_LEVEL_NONE,
+    format_log,
+)
 
 import asyncio
+import contextlib
+import contextvars
+import sys
 import socket
 import re
 import random
 import logging
+from types import ModuleType
 from zeroconf.asyncio import AsyncZeroconf
 from zeroconf import ServiceInfo
 
+np: ModuleType | None
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 logger = logging.getLogger(__name__)
 
+CONNECTION_CHECK_INTERVAL = 30.0
+
+class _StateBatch:
+    __slots__ = ("changes", "closed")
+
+    def __init__(self):
+        self.changes = {}
+        self.closed = False
+
 class Device:
     def __init__(
             self,
@@ -30,7 +61,10 @@ class Device:
             suggested_area=None,
             network=None,
             board=None,
-            platform=None
+            platform=None,
+            log_level=LOG_LEVEL_DEBUG,
+            columnar_sensors=False,
+            encryption_key=None,
     ):
         self.name = name
         self.mac_address = mac_address or self._generate_mac_address()
@@ -43,10 +77,36 @@ class Device:
         self.network = network
         self.board = board
         self.platform = platform
-        self.entities = []
+        self.log_level = log_level
+        self.encryption_key = encryption_key
+        self.noise_psk = decode_encryption_key(encryption_key) if encryption_key else None
+        self._log_subscribers = {}
+        self._subscriber_log_level = LOG_LEVEL_NONE
+        self._entities = {}
+        self._entities_by_object_id = {}
+        self._entities_by_unique_id = {}
+        self._entities_by_domain = {}
+        self._next_key = 1
+        self._subscriptions = {}
+        self._subscriptions_dirty = True
+        self._command_routes = {}
+        self.rejected_commands = 0
+        self._list_entities_cache = None
+        self.state_snapshot = StateSnapshot(self)
+        self.sensor_store = SensorValueStore() if columnar_sensors else None
+        # Scoped to the task that opened the batch, so unrelated tasks
+        # publishing meanwhile aren't held back by it
+        self._state_batch = contextvars.ContextVar(f"state_batch_{id(self)}", default=None)
         self.zeroconf = None
+        self._owns_zeroconf = True
         self.service_info = None
+        self.api_server = None
+        self.web_server = None
+        self.runtime_profile = DEFAULT_RUNTIME_PROFILE
+        self._connection_checks = []
+        self._connection_check_task = None
         self.running = True
+        self.boot_id = "%08x" % random.getrandbits(32)
         self.api_port = None
         self.web_port = None
 
@@ -76,17 +136,90 @@ class Device:
             mac_address=self.mac_address,
         )
 
-    async def log(self, level, tag, message):
-        caller = getframeinfo(stack()[1][0])
-        formatted_log = format_log(level, tag, caller.lineno, message)
-        print(formatted_log)
-        try:
-            await self.publish(None, 'log', (level, formatted_log))
-        except Exception as e:
-            logger.error(f"Error publishing log: {e}", exc_info=True)
+    async def build_list_entities_packets(self):
+        # Entity metadata is static once added, so the whole response is
+        # built once and reused for every client until it's invalidated.
+        if self._list_entities_cache is None:
+            packets = []
+            for entity in self.entities:
+                msg = await entity.build_list_entities_response()
+                if msg is not None:
+                    packets.append(message_to_packet(msg))
+            packets.append(message_to_packet(ListEntitiesDoneResponse()))
 
-    async def publish(self, publisher, key, message):
+            self._list_entities_cache = (packets, encode_plaintext_frames(packets))
+
+        return self._list_entities_cache
+
+    def invalidate_list_entities(self):
+        self._list_entities_cache = None
+
+    def set_log_subscription(self, subscriber, level):
+        if level:
+            self._log_subscribers[subscriber] = level
+        else:
+            self._log_subscribers.pop(subscriber, None)
+
+        self._subscriber_log_level = max(self._log_subscribers.values(), default=LOG_LEVEL_NONE)
+
+    async def log(self, level, tag, message, *args):
+        # Nothing is formatted unless stdout or a log subscriber wants this level
+        if level > self.log_level and level > self._subscriber_log_level:
+            return
+
+        if args:
+            message = message % args
+
+        formatted_log = format_log(level, tag, sys._getframe(1).f_lineno, message)
+        if level <= self.log_level:
+            print(formatted_log)
+
+        if level <= self._subscriber_log_level:
+            try:
+                await self.publish(None, 'log', (level, formatted_log))
+            except Exception as e:
+                logger.error(f"Error publishing log: {e}", exc_info=True)
+
+    def _build_subscriptions(self):
+        subscriptions = {}
         for entity in self.entities:
+            for subscription in entity.subscriptions():
+                subscribers = subscriptions.setdefault(subscription, [])
+                if entity not in subscribers:
+                    subscribers.append(entity)
+
+        self._subscriptions = subscriptions
+        self._subscriptions_dirty = False
+
+    def invalidate_subscriptions(self):
+        self._subscriptions_dirty = True
+
+    def get_subscribers(self, key, message):
+        if self._subscriptions_dirty:
+            self._build_subscriptions()
+
+        subscriptions = self._subscriptions
+        message_type = type(message)
+        entity_key = getattr(message, 'key', None)
+        entity_keys = (None,) if entity_key is None else (entity_key, None)
+
+        subscribers = []
+        for sub_key in (key, None):
+            for sub_type in (message_type, None):
+                for sub_entity_key in entity_keys:
+                    matched = subscriptions.get((sub_key, sub_type, sub_entity_key))
+                    if matched:
+                        subscribers.extend(matched)
+
+        if len(subscribers) > 1:
+            subscribers = list(dict.fromkeys(subscribers))
+        return subscribers
+
+    async def publish(self, publisher, key, message):
+        await self._dispatch(publisher, self.get_subscribers(key, message), key, message)
+
+    async def _dispatch(self, publisher, subscribers, key, message):
+        for entity in subscribers:
             if publisher == entity:
                 continue
             try:
@@ -97,47 +230,250 @@ class Device:
             except Exception as e:
                 logger.error(f"Error publishing to {entity.name}: {e}", exc_info=True)
 
-    def add_entity(self, entity):
+    @contextlib.asynccontextmanager
+    async def batch_state_changes(self):
+        # State changes made inside the block are published together when it
+        # exits, with only the latest state of each entity.
+        outer = self._state_batch.get()
+        if outer is not None and not outer.closed:
+            yield
+            return
+
+        batch = _StateBatch()
+        token = self._state_batch.set(batch)
+        try:
+            yield
+        finally:
+            self._state_batch.reset(token)
+            # Tasks started inside the block copied the context, they must
+            # publish on their own from now on
+            batch.closed = True
+            if batch.changes:
+                await self.publish_state_changes(list(batch.changes.values()))
+
+    def defer_state_change(self, entity, message):
+        batch = self._state_batch.get()
+        if batch is None or batch.closed:
+            return False
+        batch.changes[entity.key] = (entity, message)
+        return True
+
+    async def publish_state_changes(self, changes):
+        # Subscribers to 'state_changes' take the whole batch in one call,
+        # everyone else still gets a 'state_change' per entity.
+        batch_subscribers = self.get_subscribers('state_changes', changes)
+        await self._dispatch(None, batch_subscribers, 'state_changes', [m for _e, m in changes])
+
+        for entity, message in changes:
+            subscribers = [
+                s for s in self.get_subscribers('state_change', message)
+                if s not in batch_subscribers
+            ]
+            await self._dispatch(entity, subscribers, 'state_change', message)
+
+    async def update_sensors(self, keys, values):
+        """Set many sensor values at once.
+
+        keys and values may be sequences or NumPy arrays. Only sensors whose
+        value changed are notified, and their states go out as one batch.
+        Returns the number of changed sensors.
+        """
+        if np is not None and isinstance(keys, np.ndarray):
+            keys = keys.tolist()
+
+        sensors = []
+        for key in keys:
+            entity = self._entities.get(key)
+            if entity is None or entity.DOMAIN != "sensor":
+                raise ValueError(f"Unknown sensor key: {key}")
+            sensors.append(entity)
+
+        if len(sensors) != len(values):
+            raise ValueError(f"Got {len(values)} values for {len(sensors)} sensors")
+
+        if any(e._filters is not None for e in sensors):
+            changed = self._filter_sensor_values(sensors, values)
+        else:
+            changed = self._changed_sensors(sensors, values)
+
+        async with self.batch_state_changes():
+            for entity, value in changed:
+                entity.value = value
+                await entity.notify_state_change()
+
+        await self.log(3, "sensor", "Updated %d of %d sensor values", len(changed), len(sensors))
+        return len(changed)
+
+    def _filter_sensor_values(self, sensors, values):
+        if np is not None and isinstance(values, np.ndarray):
+            values = values.tolist()
+
+        plain = []
+        plain_values = []
+        filtered = []
+        for entity, value in zip(sensors, values):
+            if entity._filters is None:
+                plain.append(entity)
+                plain_values.append(value)
+                continue
+            value = entity.filter_value(value)
+            if value is not None and value != entity.value:
+                filtered.append((entity, value))
+
+        return self._changed_sensors(plain, plain_values) + filtered
+
+    def _changed_sensors(self, sensors, values):
+        if np is None or not sensors:
+            return [(e, v) for e, v in zip(sensors, values) if e.value != v]
+
+        new = np.asarray(values, dtype=float)
+        store = self.sensor_store
+        if store is not None and all(e._store is store for e in sensors):
+            indexes = np.fromiter((e.key for e in sensors), dtype=np.intp, count=len(sensors))
+            old = np.frombuffer(store.values, dtype=float)[indexes]
+        else:
+            old = np.fromiter((e.value for e in sensors), dtype=float, count=len(sensors))
+
+        new_values = new.tolist()
+        return [(sensors[i], new_values[i]) for i in np.flatnonzero(old != new).tolist()]
+
+    async def route_command(self, publisher, message):
+        key = getattr(message, 'key', None)
+        if key is None:
+            await self.publish(publisher, 'client_request', message)
+            return
+
+        entity = self._command_routes.get((type(message), key))
+        if entity is None:
+            if key not in self._entities:
+                self.rejected_commands += 1
+                logger.warning(f"Rejected {type(message).__name__} for unknown key {key}")
+                return
+            # No direct route, entities handling it themselves still get it
+            await self.publish(publisher, 'client_request', message)
+            return
+
+        try:
+            await entity.handle_command(message)
+        except Exception as e:
+            logger.error(f"Error handling command for {entity.name}: {e}", exc_info=True)
+
+        # Listeners for the target entity still see the command
+        subscribers = self.get_subscribers('client_request', message)
+        if subscribers:
+            subscribers = [e for e in subscribers if e is not entity]
+            await self._dispatch(publisher, subscribers, 'client_request', message)
+
+    @property
+    def entities(self):
+        return self._entities.values()
+
+    def add_entity(self, entity, key=None):
         entity.device = self
-        entity.key = len(self.entities) + 1
 
-        existing_entity = [e for e in self.entities if e.object_id == entity.object_id]
-        if len(existing_entity) > 0:
+        if entity.object_id in self._entities_by_object_id:
             raise ValueError(f"Duplicate object_id: {entity.object_id}")
 
-        self.entities.append(entity)
+        if key is None:
+            # Keys are never reused so clients can't confuse a removed entity with a new one
+            key = self._next_key
+            self._next_key += 1
+        elif key in self._entities:
+            raise ValueError(f"Duplicate key: {key}")
+
+        entity.key = key
+        self._entities[key] = entity
+        self._entities_by_object_id[entity.object_id] = entity
+        self._entities_by_unique_id[entity.unique_id] = entity
+        self._entities_by_domain.setdefault(entity.DOMAIN, {})[key] = entity
+        self._subscriptions_dirty = True
+        self.invalidate_list_entities()
+        # Once the snapshot has loaded it only rebuilds keys marked stale
+        self.state_snapshot.invalidate(entity)
+
+        for command_type in entity.COMMAND_TYPES:
+            self._command_routes[(command_type, entity.key)] = entity
+
+        if self.sensor_store is not None and hasattr(entity, "attach_store"):
+            entity.attach_store(self.sensor_store)
+
+    def remove_entity(self, entity):
+        if self._entities.get(entity.key) is not entity:
+            raise ValueError(f"Entity not on this device: {entity.object_id}")
+
+        del self._entities[entity.key]
+        del self._entities_by_object_id[entity.object_id]
+        self._entities_by_unique_id.pop(entity.unique_id, None)
+        self._entities_by_domain[entity.DOMAIN].pop(entity.key, None)
+        self._subscriptions_dirty = True
+        self.invalidate_list_entities()
+        self.state_snapshot.remove(entity)
+
+        for command_type in entity.COMMAND_TYPES:
+            self._command_routes.pop((command_type, entity.key), None)
+
+        entity.cancel_pending_publish()
+
+        # Timer filters would otherwise fire and publish for an entity that's gone
+        filters = getattr(entity, "_filters", None)
+        if filters is not None:
+            filters.cancel()
+
+        if hasattr(entity, "detach_store"):
+            entity.detach_store()
+
+    def replace_entity(self, old_entity, new_entity):
+        # The replacement keeps the old key, so clients see it as the same entity
+        key = old_entity.key
+        self.remove_entity(old_entity)
+        self.add_entity(new_entity, key=key)
 
     def get_entity(self, object_id):
-        for entity in self.entities:
-            if entity.object_id == object_id:
-                return entity
-        return None
+        return self._entities_by_object_id.get(object_id)
 
     def get_entity_by_key(self, key):
-        if key > len(self.entities):
-            return None
-        return self.entities[key - 1]
+        return self._entities.get(key)
 
-    async def run(self, api_port, web_port):
+    def get_entity_by_unique_id(self, unique_id):
+        return self._entities_by_unique_id.get(unique_id)
+
+    def get_entities_by_domain(self, domain):
+        return self._entities_by_domain.get(domain, {}).values()
+
+    def add_servers(self, api_port, web_port):
+        # web_port=None leaves the web server unbound, for a DeviceHost to mount
         from . import NativeApiServer, WebServer
 
+        if self.api_server is not None:
+            return
+
         self.api_port = api_port
         self.web_port = web_port
 
-        self.add_entity(NativeApiServer(name="_server", port=self.api_port))
-        self.add_entity(WebServer(name="_web_server", port=self.web_port))
+        self.api_server = NativeApiServer(name="_server", port=self.api_port)
+        self.web_server = WebServer(name="_web_server", port=self.web_port)
+        self.add_entity(self.api_server)
+        self.add_entity(self.web_server)
+
+    async def run(self, api_port, web_port, zeroconf=None, runtime_profile=None):
+        # uvloop needs the loop to be created by runtime_profile.run(), the
+        # rest of the profile is applied here.
+        if runtime_profile is not None:
+            self.runtime_profile = runtime_profile
+            runtime_profile.configure_loop(asyncio.get_running_loop())
+
+        self.add_servers(api_port, web_port)
 
         while self.running:
             try:
-                self.zeroconf = await self.register_zeroconf(self.api_port)
+                self.zeroconf = await self.register_zeroconf(self.api_port, zeroconf)
+                self.schedule_connection_checks()
 
                 async with asyncio.TaskGroup() as tg:
-                    for entity in self.entities:
+                    for entity in list(self.entities):
                         if hasattr(entity, 'run'):
                             tg.create_task(entity.run())
 
-                    tg.create_task(self.heartbeat())
-
             except ConnectionResetError:
                 logger.warning("Connection reset. Restarting servers in 5 seconds...")
                 await asyncio.sleep(5)
@@ -150,55 +486,75 @@ class Device:
 
         await self.shutdown()
 
-    async def heartbeat(self):
-        while self.running:
+    def schedule_connection_checks(self):
+        # Entities with a check_connection() method are polled from the
+        # shared scheduler, devices without any don't get a timer at all.
+        self._connection_checks = [e for e in self.entities if hasattr(e, 'check_connection')]
+        if self._connection_checks:
+            get_scheduler().schedule(self, CONNECTION_CHECK_INTERVAL, self._start_connection_checks)
+
+    def _start_connection_checks(self):
+        if not self.running:
+            return
+        self._connection_check_task = asyncio.get_running_loop().create_task(self.check_connections())
+        get_scheduler().schedule(self, CONNECTION_CHECK_INTERVAL, self._start_connection_checks)
+
+    async def check_connections(self):
+        for entity in self._connection_checks:
             try:
-                for entity in self.entities:
-                    if hasattr(entity, 'check_connection'):
-                        await entity.check_connection()
-                await asyncio.sleep(30)  # Heartbeat every 30 seconds
+                await entity.check_connection()
             except Exception as e:
-                logger.error(f"Error in heartbeat: {e}", exc_info=True)
+                logger.error(f"Error checking connection of {entity.name}: {e}", exc_info=True)
 
     async def shutdown(self):
         self.running = False
-        for entity in self.entities:
+        get_scheduler().cancel(self)
+        for entity in list(self.entities):
             if hasattr(entity, 'stop'):
                 await entity.stop()
         await self.unregister_zeroconf()
 
-    async def register_zeroconf(self, port):
+    @property
+    def sanitized_name(self):
+        return re.sub(r'[^a-zA-Z0-9]', '_', self.name).lower()
+
+    def build_service_info(self, port):
+        service_type = "_esphomelib._tcp.local."
+        sanitized_name = self.sanitized_name
+
+        properties = {
+            "network": self.network or "wifi",
+            "board": self.board or "esp01_1m",
+            "platform": self.platform or "ESP8266",
+            "mac": self.mac_address.replace(":", "").lower(),
+            "version": self.project_version,
+            "friendly_name": self.friendly_name or self.name,
+            "api_version": "1.5.0",  # Added from BasicEntity
+            "manufacturer": self.manufacturer,
+            "model": self.model,
+            "name": self.name,
+            "project_name": self.project_name,
+        }
+        if self.noise_psk is not None:
+            properties["api_encryption"] = NOISE_PROTOCOL_NAME.decode()
+
+        return ServiceInfo(
+            service_type,
+            f"{sanitized_name}.{service_type}",
+            addresses=[socket.inet_aton(self._get_ip_address())],
+            port=port,
+            properties=properties,
+            server=f"{sanitized_name}.local.",
+        )
+
+    async def register_zeroconf(self, port, zeroconf=None):
+        # A shared zeroconf instance (see DeviceHost) is left open on shutdown
+        self._owns_zeroconf = zeroconf is None
         try:
-            zeroconf = AsyncZeroconf()
-            service_type = "_esphomelib._tcp.local."
-            
-            sanitized_name = re.sub(r'[^a-zA-Z0-9]', '_', self.name).lower()
-            
-            service_name = f"{sanitized_name}.{service_type}"
-            ip_address = self._get_ip_address()
-            hostname = f"{sanitized_name}.local."
-
-            service_info = ServiceInfo(
-                service_type,
-                service_name,
-                addresses=[socket.inet_aton(ip_address)],
-                port=port,
-                properties={
-                    "network": self.network or "wifi",
-                    "board": self.board or "esp01_1m",
-                    "platform": self.platform or "ESP8266",
-                    "mac": self.mac_address.replace(":", "").lower(),
-                    "version": self.project_version,
-                    "friendly_name": self.friendly_name or self.name,
-                    "api_version": "1.5.0",  # Added from BasicEntity
-                    "manufacturer": self.manufacturer,
-                    "model": self.model,
-                    "name": self.name,
-                    "project_name": self.project_name,
-                },
-                server=hostname,
-            )
+            if zeroconf is None:
+                zeroconf = AsyncZeroconf()
 
+            service_info = self.build_service_info(port)
             await zeroconf.async_register_service(service_info)
             self.service_info = service_info
             return zeroconf
@@ -210,6 +566,7 @@ class Device:
         if self.zeroconf and self.service_info:
             try:
                 await self.zeroconf.async_unregister_service(self.service_info)
-                await self.zeroconf.async_close()
+                if self._owns_zeroconf:
+                    await self.zeroconf.async_close()
             except Exception as e:
                 logger.error(f"Error unregistering zeroconf: {e}", exc_info=True)
\ No newline at end of file
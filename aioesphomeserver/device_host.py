@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+
+from aiohttp import web
+from zeroconf.asyncio import AsyncZeroconf
+
+logger = logging.getLogger(__name__)
+
+class DeviceHost:
+    """Runs many Devices in one process.
+
+    Native API clients expect one device per port, so every device still
+    listens on its own API port, allocated upwards from api_port_start.
+    Everything else is shared: one AsyncZeroconf instance announces all of
+    the devices, and one web server mounts each device's routes under
+    /<prefix>/ (the sanitized device name unless given).
+    """
+
+    def __init__(self, web_port=8080, api_port_start=6053, address="0.0.0.0"):
+        self.web_port = web_port
+        self.api_port_start = api_port_start
+        self.address = address
+        self.devices = {}
+        self.zeroconf = None
+        self._used_ports = set()
+        self._next_port = api_port_start
+
+    def _port_available(self, port):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind((self.address, port))
+            except OSError:
+                return False
+        return True
+
+    def allocate_port(self):
+        while self._next_port in self._used_ports or not self._port_available(self._next_port):
+            self._next_port += 1
+            if self._next_port > 65535:
+                raise RuntimeError(f"No free API ports above {self.api_port_start}")
+        port = self._next_port
+        self._used_ports.add(port)
+        self._next_port += 1
+        return port
+
+    def add_device(self, device, api_port=None, prefix=None):
+        prefix = prefix or device.sanitized_name
+        if prefix in self.devices:
+            raise ValueError(f"Duplicate device prefix: {prefix}")
+
+        if api_port is None:
+            api_port = self.allocate_port()
+        elif api_port in self._used_ports:
+            raise ValueError(f"API port {api_port} is already in use")
+        else:
+            self._used_ports.add(api_port)
+
+        device.add_servers(api_port, None)
+        self.devices[prefix] = device
+        return device
+
+    def get_device(self, prefix):
+        return self.devices.get(prefix)
+
+    async def index(self, _request):
+        return web.json_response([
+            {
+                "name": device.name,
+                "path": f"/{prefix}/",
+                "api_port": device.api_port,
+            }
+            for prefix, device in self.devices.items()
+        ])
+
+    async def build_app(self):
+        app = web.Application()
+        app.router.add_route("GET", "/", self.index)
+        for prefix, device in self.devices.items():
+            app.add_subapp(f"/{prefix}/", await device.web_server.build_app())
+        return app
+
+    async def run(self, runtime_profile=None):
+        self.zeroconf = AsyncZeroconf()
+
+        runner = web.AppRunner(await self.build_app())
+        await runner.setup()
+        site = web.TCPSite(runner, self.address, self.web_port)
+        await site.start()
+        logger.info(f"Hosting {len(self.devices)} devices, web server on port {self.web_port}")
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for device in self.devices.values():
+                    tg.create_task(device.run(
+                        device.api_port,
+                        None,
+                        zeroconf=self.zeroconf,
+                        runtime_profile=runtime_profile,
+                    ))
+        finally:
+            await runner.cleanup()
+            await self.zeroconf.async_close()
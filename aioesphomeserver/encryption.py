@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import binascii
+import logging
+from functools import partial
+from struct import Struct
+
+from chacha20poly1305_reuseable import ChaCha20Poly1305Reusable
+from cryptography.exceptions import InvalidTag
+from google.protobuf.message import DecodeError
+from noise.backends.default import DefaultNoiseBackend  # type: ignore[import-untyped]
+from noise.backends.default.ciphers import ChaCha20Cipher  # type: ignore[import-untyped]
+from noise.connection import NoiseConnection  # type: ignore[import-untyped]
+from noise.exceptions import NoiseHandshakeError, NoiseInvalidMessage  # type: ignore[import-untyped]
+
+from aioesphomeapi.core import MESSAGE_TYPE_TO_PROTO
+
+from .framing import ProtocolError
+
+logger = logging.getLogger(__name__)
+
+NOISE_PROTOCOL_NAME = b"Noise_NNpsk0_25519_ChaChaPoly_SHA256"
+NOISE_PROLOGUE = b"NoiseAPIInit"
+NOISE_PREAMBLE = 0x01
+NOISE_PROTOCOL_ID = 0x01
+
+STATE_HELLO = 1
+STATE_HANDSHAKE = 2
+STATE_READY = 3
+STATE_FAILED = 4
+
+_FRAME_HEADER = Struct(">BH")
+_MESSAGE_HEADER = Struct(">HH")
+PACK_NONCE = partial(Struct("<LQ").pack, 0)
+
+class _ReusableChaCha20Cipher(ChaCha20Cipher):
+    # The default backend builds a new AEAD for every message
+    format_nonce = PACK_NONCE
+
+    @property
+    def klass(self):
+        return ChaCha20Poly1305Reusable
+
+class _NoiseBackend(DefaultNoiseBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ciphers["ChaChaPoly"] = _ReusableChaCha20Cipher
+
+NOISE_BACKEND = _NoiseBackend()
+
+def decode_encryption_key(key):
+    """Decode a base64 API encryption key, as used in ESPHome's api: config."""
+    try:
+        psk = binascii.a2b_base64(key)
+    except (binascii.Error, ValueError):
+        raise ValueError("Malformed encryption key, expected base64") from None
+    if len(psk) != 32:
+        raise ValueError("Malformed encryption key, expected 32 bytes of base64 data")
+    return psk
+
+def encode_noise_frame(payload):
+    return _FRAME_HEADER.pack(NOISE_PREAMBLE, len(payload)) + payload
+
+class NoiseFrameHelper:
+    """Server side of the Noise_NNpsk0 encrypted native API.
+
+    Plays the responder in the handshake that aioesphomeapi's client
+    starts, then keeps one reusable ChaCha20-Poly1305 cipher per direction
+    and counts nonces itself, so the Noise state machine is only used once
+    per connection. Handshake replies go out through `write`.
+    """
+
+    encrypted = True
+
+    def __init__(self, psk, server_name, write):
+        self._psk = psk
+        self._server_name = server_name
+        self._write = write
+        self._buffer = bytearray()
+        self._state = STATE_HELLO
+        self._proto = None
+        self._encrypt = None
+        self._decrypt = None
+        self._send_nonce = 0
+        self._recv_nonce = 0
+
+    @property
+    def ready(self):
+        return self._state == STATE_READY
+
+    def feed(self, data):
+        if self._state == STATE_FAILED:
+            return []
+
+        buf = self._buffer
+        buf += data
+        end = len(buf)
+        pos = 0
+        messages = []
+
+        with memoryview(buf) as view:
+            while end - pos >= 3:
+                preamble, length = _FRAME_HEADER.unpack_from(buf, pos)
+                if preamble != NOISE_PREAMBLE:
+                    self._fail("Invalid preamble")
+                    raise ProtocolError(f"Invalid preamble {preamble:#x}, is the client using plaintext?")
+
+                frame_end = pos + 3 + length
+                if frame_end > end:
+                    break
+
+                with view[pos + 3:frame_end] as payload:
+                    if self._state == STATE_READY:
+                        msg = self._decode_message(payload)
+                        if msg is not None:
+                            messages.append(msg)
+                    elif self._state == STATE_HELLO:
+                        self._handle_hello(payload)
+                    else:
+                        self._handle_handshake(payload)
+                pos = frame_end
+
+        if pos:
+            del buf[:pos]
+
+        return messages
+
+    def _handle_hello(self, payload):
+        proto = NoiseConnection.from_name(NOISE_PROTOCOL_NAME, backend=NOISE_BACKEND)
+        proto.set_as_responder()
+        proto.set_psks(self._psk)
+        # The client hello is bound into the handshake through the prologue
+        proto.set_prologue(NOISE_PROLOGUE + len(payload).to_bytes(2, "big") + bytes(payload))
+        proto.start_handshake()
+        self._proto = proto
+
+        self._write(encode_noise_frame(
+            bytes((NOISE_PROTOCOL_ID,)) + self._server_name.encode() + b"\0"
+        ))
+        self._state = STATE_HANDSHAKE
+
+    def _handle_handshake(self, payload):
+        if not payload or payload[0] != 0x00:
+            self._fail("Bad handshake packet")
+            raise ProtocolError("Bad handshake packet")
+
+        proto = self._proto
+        try:
+            proto.read_message(bytes(payload[1:]))
+            reply = proto.write_message()
+        except (InvalidTag, NoiseHandshakeError, NoiseInvalidMessage) as e:
+            self._fail("Handshake MAC failure")
+            raise ProtocolError("Handshake MAC failure, does the client have the right key?") from e
+
+        self._write(encode_noise_frame(b"\0" + reply))
+
+        protocol = proto.noise_protocol
+        self._encrypt = ChaCha20Poly1305Reusable(protocol.cipher_state_encrypt.k).encrypt
+        self._decrypt = ChaCha20Poly1305Reusable(protocol.cipher_state_decrypt.k).decrypt
+        self._proto = None
+        self._state = STATE_READY
+
+    def _fail(self, reason):
+        self._state = STATE_FAILED
+        self._proto = None
+        self._write(encode_noise_frame(b"\x01" + reason.encode()))
+
+    def _decode_message(self, payload):
+        try:
+            msg = self._decrypt(PACK_NONCE(self._recv_nonce), payload, None)
+        except InvalidTag:
+            self._state = STATE_FAILED
+            raise ProtocolError("Failed to decrypt frame") from None
+        self._recv_nonce += 1
+
+        if len(msg) < _MESSAGE_HEADER.size:
+            raise ProtocolError("Encrypted frame too short")
+        msg_type, length = _MESSAGE_HEADER.unpack_from(msg)
+        klass = MESSAGE_TYPE_TO_PROTO.get(msg_type)
+        if klass is None:
+            return None
+        message = klass()
+        try:
+            with memoryview(msg) as view:
+                message.MergeFromString(view[4:4 + length])
+        except DecodeError as e:
+            raise ProtocolError(f"Invalid {klass.__name__}: {e}") from None
+        return message
+
+    def encode_frames(self, packets):
+        """Encrypt packets into a list of buffers ready for writelines().
+
+        Each frame contributes its 3 byte header and the ciphertext as
+        separate buffers, so nothing is joined after encryption.
+        """
+        encrypt = self._encrypt
+        nonce = self._send_nonce
+        out = []
+        for msg_type, data in packets:
+            frame = encrypt(PACK_NONCE(nonce), _MESSAGE_HEADER.pack(msg_type, len(data)) + data, None)
+            nonce += 1
+            out.append(_FRAME_HEADER.pack(NOISE_PREAMBLE, len(frame)))
+            out.append(frame)
+        self._send_nonce = nonce
+        return out
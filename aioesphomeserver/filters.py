@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+class Filter:
+    """A step in a FilterChain, modelled on ESPHome's sensor filters.
+
+    new_value() returns the value to pass on to the next filter, or None to
+    stop it here. Time based filters can emit later by calling output().
+    """
+
+    def __init__(self):
+        self._output = None
+
+    def bind(self, output):
+        self._output = output
+
+    def new_value(self, value):
+        return value
+
+    def output(self, value):
+        if self._output is not None:
+            self._output(value)
+
+    def cancel(self):
+        pass
+
+class ThrottleFilter(Filter):
+    """Pass at most one value every `interval` seconds."""
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._last = None
+
+    def new_value(self, value):
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval:
+            return None
+        self._last = now
+        return value
+
+class DeltaFilter(Filter):
+    """Pass a value only when it differs from the last passed value by at least
+    `delta`, or by `delta` percent of it when `percentage` is set."""
+
+    def __init__(self, delta, percentage=False):
+        super().__init__()
+        self.delta = delta
+        self.percentage = percentage
+        self._last = None
+
+    def new_value(self, value):
+        if self._last is not None and not math.isnan(self._last):
+            threshold = abs(self._last) * self.delta / 100 if self.percentage else self.delta
+            if abs(value - self._last) < threshold:
+                return None
+        self._last = value
+        return value
+
+class SlidingWindowMovingAverageFilter(Filter):
+    """Average of the last `window_size` values, sent every `send_every` values.
+
+    Values live in a fixed array('d') ring buffer with a running sum, so each
+    value costs O(1) however large the window is. NaN values are skipped.
+    """
+
+    def __init__(self, window_size=15, send_every=15, send_first_at=1):
+        super().__init__()
+        if window_size < 1:
+            raise ValueError("window_size must be at least 1")
+        self.window_size = window_size
+        self.send_every = send_every
+        self._window = array('d', bytes(8 * window_size))
+        self._pos = 0
+        self._count = 0
+        self._sum = 0.0
+        self._send_at = send_every - send_first_at
+
+    def new_value(self, value):
+        if not math.isnan(value):
+            window = self._window
+            if self._count < self.window_size:
+                self._count += 1
+            else:
+                self._sum -= window[self._pos]
+            window[self._pos] = value
+            self._sum += value
+            self._pos += 1
+            if self._pos == self.window_size:
+                # Resum once per lap so rounding errors can't pile up
+                self._pos = 0
+                self._sum = math.fsum(window)
+
+        self._send_at += 1
+        if self._send_at < self.send_every:
+            return None
+        self._send_at = 0
+        return self._sum / self._count if self._count else math.nan
+
+class ExponentialMovingAverageFilter(Filter):
+    """Exponential moving average with weight `alpha` for new values, sent
+    every `send_every` values."""
+
+    def __init__(self, alpha=0.1, send_every=15, send_first_at=1):
+        super().__init__()
+        self.alpha = alpha
+        self.send_every = send_every
+        self._average = None
+        self._send_at = send_every - send_first_at
+
+    def new_value(self, value):
+        if not math.isnan(value):
+            if self._average is None:
+                self._average = value
+            else:
+                self._average = self.alpha * value + (1 - self.alpha) * self._average
+
+        self._send_at += 1
+        if self._send_at < self.send_every:
+            return None
+        self._send_at = 0
+        return math.nan if self._average is None else self._average
+
+class OrFilter(Filter):
+    """Feed every value to several filters and pass on whatever any of them
+    produces, e.g. a throttle OR a delta so large jumps aren't held back."""
+
+    def __init__(self, *filters):
+        super().__init__()
+        self.filters = filters
+        for f in filters:
+            f.bind(self.output)
+
+    def new_value(self, value):
+        result = None
+        for f in self.filters:
+            out = f.new_value(value)
+            if result is None:
+                result = out
+        return result
+
+    def cancel(self):
+        for f in self.filters:
+            f.cancel()
+
+class _TimerFilter(Filter):
+    def __init__(self):
+        super().__init__()
+        self._timer = None
+
+    def _schedule(self, delay, value):
+        self.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._fire, value)
+
+    def _fire(self, value):
+        self._timer = None
+        self.output(value)
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+class DebounceFilter(_TimerFilter):
+    """Pass a value only once no new value has arrived for `delay` seconds."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def new_value(self, value):
+        self._schedule(self.delay, value)
+        return None
+
+class DelayedOnOffFilter(_TimerFilter):
+    """Binary sensor filter: a value only passes once it has held for
+    `on_delay` (True) or `off_delay` (False) seconds."""
+
+    def __init__(self, on_delay=0, off_delay=0):
+        super().__init__()
+        self.on_delay = on_delay
+        self.off_delay = off_delay
+
+    def new_value(self, value):
+        delay = self.on_delay if value else self.off_delay
+        if not delay:
+            self.cancel()
+            return value
+        self._schedule(delay, value)
+        return None
+
+class DelayedOnFilter(DelayedOnOffFilter):
+    def __init__(self, delay):
+        super().__init__(on_delay=delay)
+
+class DelayedOffFilter(DelayedOnOffFilter):
+    def __init__(self, delay):
+        super().__init__(off_delay=delay)
+
+class FilterChain:
+    """Runs values through a list of filters.
+
+    push() returns the filtered value straight away, or None if a filter
+    held it back. Values a filter emits later are handed to the `publish`
+    coroutine function in a new task.
+    """
+
+    def __init__(self, filters, publish):
+        self.filters = list(filters)
+        self.publish = publish
+        self._tasks = set()
+        for i, f in enumerate(self.filters):
+            f.bind(lambda value, start=i + 1: self._emit(start, value))
+
+    def push(self, value):
+        return self._run(0, value)
+
+    def _run(self, start, value):
+        for f in self.filters[start:]:
+            value = f.new_value(value)
+            if value is None:
+                return None
+        return value
+
+    def _emit(self, start, value):
+        value = self._run(start, value)
+        if value is None:
+            return
+
+        try:
+            task = asyncio.get_running_loop().create_task(self.publish(value))
+        except RuntimeError:
+            logger.warning("Dropping filtered value, no running event loop")
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cancel(self):
+        for f in self.filters:
+            f.cancel()
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+from aioesphomeapi.core import MESSAGE_TYPE_TO_PROTO
+from google.protobuf.message import DecodeError
+
+PROTO_TO_MESSAGE_TYPE = {v: k for k, v in MESSAGE_TYPE_TO_PROTO.items()}
+
+READ_BUFFER_SIZE = 65536
+# Clients only send small requests, anything bigger is garbage or abuse
+MAX_FRAME_SIZE = 1024 * 1024
+
+class ProtocolError(Exception):
+    pass
+
+def _varuint_to_bytes(value: int) -> bytes:
+    """Convert a varuint to bytes."""
+    if value <= 0x7F:
+        return bytes((value,))
+
+    result = bytearray()
+    while value:
+        temp = value & 0x7F
+        value >>= 7
+        if value:
+            result.append(temp | 0x80)
+        else:
+            result.append(temp)
+    return bytes(result)
+
+varuint_to_bytes = lru_cache(maxsize=1024)(_varuint_to_bytes)
+
+def encode_plaintext_frame(msg_type: int, data: bytes) -> bytes:
+    return b"".join((b"\0", varuint_to_bytes(len(data)), varuint_to_bytes(msg_type), data))
+
+def encode_plaintext_frames(packets) -> bytes:
+    out = []
+    for msg_type, data in packets:
+        out.append(b"\0")
+        out.append(varuint_to_bytes(len(data)))
+        out.append(varuint_to_bytes(msg_type))
+        out.append(data)
+    return b"".join(out)
+
+def message_to_packet(msg):
+    return (PROTO_TO_MESSAGE_TYPE[type(msg)], msg.SerializeToString())
+
+def _read_varuint(buf, pos, end):
+    result = 0
+    bitpos = 0
+    while pos < end:
+        val = buf[pos]
+        pos += 1
+        result |= (val & 0x7F) << bitpos
+        if (val & 0x80) == 0:
+            return result, pos
+        bitpos += 7
+    return -1, pos
+
+class FrameDecoder:
+    """Incrementally decodes plaintext native API frames from a byte stream.
+
+    Bytes are accumulated in a single reusable buffer and every complete frame
+    available after a read is decoded in one pass, so a burst of commands costs
+    one wakeup instead of several reads per frame.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        buf = self._buffer
+        buf += data
+        end = len(buf)
+        pos = 0
+        messages = []
+
+        with memoryview(buf) as view:
+            while pos < end:
+                if buf[pos] != 0x00:
+                    raise ProtocolError(f"Invalid preamble {buf[pos]:#x}, is the client using encryption?")
+
+                length, header_pos = _read_varuint(buf, pos + 1, end)
+                if length == -1:
+                    if end - pos > 10:
+                        raise ProtocolError("Invalid frame length")
+                    break
+                if length > MAX_FRAME_SIZE:
+                    raise ProtocolError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+                msg_type, type_pos = _read_varuint(buf, header_pos, end)
+                if msg_type == -1:
+                    if end - header_pos > 10:
+                        raise ProtocolError("Invalid message type")
+                    break
+                header_pos = type_pos
+
+                frame_end = header_pos + length
+                if frame_end > end:
+                    break
+
+                klass = MESSAGE_TYPE_TO_PROTO.get(msg_type)
+                if klass is not None:
+                    msg = klass()
+                    try:
+                        msg.MergeFromString(view[header_pos:frame_end])
+                    except DecodeError as e:
+                        raise ProtocolError(f"Invalid {klass.__name__}: {e}") from None
+                    messages.append(msg)
+
+                pos = frame_end
+
+        if pos:
+            del buf[:pos]
+
+        return messages
+
+class PlaintextFrameHelper:
+    """Frame helper for the plaintext protocol.
+
+    Connections talk to the wire through a frame helper: feed() turns
+    received bytes into messages and encode_frames() turns packets into a
+    list of buffers to write. NoiseFrameHelper in .encryption is the
+    encrypted counterpart.
+    """
+
+    encrypted = False
+    ready = True
+
+    def __init__(self):
+        self._decoder = FrameDecoder()
+
+    def feed(self, data):
+        return self._decoder.feed(data)
+
+    def encode_frames(self, packets):
+        return [encode_plaintext_frames(packets)]
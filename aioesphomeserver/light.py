@@ -5,13 +5,32 @@ from functools import reduce
 from aiohttp import web
 from urllib import parse
 
-import json
 from aioesphomeapi import (
     LightColorCapability,
 )
 
 class LightEntity(BasicEntity):
     DOMAIN = "light"
+    COMMAND_TYPES = (LightCommandRequest,)
+
+    __slots__ = (
+        "supported_color_modes",
+        "effects",
+        "effect",
+        "state",
+        "brightness",
+        "color_brightness",
+        "color_temperature",
+        "cold_white",
+        "warm_white",
+        "transition_length",
+        "flash_length",
+        "color_mode",
+        "red",
+        "green",
+        "blue",
+        "white",
+    )
 
     def __init__(self, *args, color_modes=[LightColorCapability.ON_OFF], effects=None, **kwargs):
         super().__init__(*args, **kwargs)
@@ -68,7 +87,7 @@ class LightEntity(BasicEntity):
 
         )
 
-    async def state_json(self):
+    async def build_state_json(self):
         state = "ON" if self.state else "OFF"
         data = {
             "id": self.json_id,
@@ -84,7 +103,7 @@ class LightEntity(BasicEntity):
             "effect": self.effect,
             "white_value": self.white
         }
-        return json.dumps(data)
+        return data
 
     async def set_state_from_command(self, command):
         # message LightCommandRequest {
@@ -129,7 +148,7 @@ class LightEntity(BasicEntity):
                 attr = getattr(command, prop)
                 current_attr = getattr(self, prop)
                 if attr != current_attr:
-                    await self.device.log(3, self.DOMAIN, f"[{self.object_id}] Setting {prop} to {attr}")
+                    await self.device.log(3, self.DOMAIN, "[%s] Setting %s to %s", self.object_id, prop, attr)
                     setattr(self, prop, attr)
                     changed = True
 
@@ -181,6 +200,14 @@ class LightEntity(BasicEntity):
 
         await self.set_state_from_command(cmd)
 
+    async def handle_web_command(self, action, params):
+        if action not in ("turn_on", "turn_off"):
+            await super().handle_web_command(action, params)
+            return
+
+        query = {k: [str(v)] for k, v in params.items()}
+        await self.set_state_from_query(action == "turn_on", query)
+
     async def handle(self, key, message):
         if type(message) == LightCommandRequest:
             if message.key == self.key:
@@ -191,10 +218,6 @@ class LightEntity(BasicEntity):
         router.add_route("POST", f"/light/{self.object_id}/turn_on", self.route_turn_on)
         router.add_route("POST", f"/light/{self.object_id}/turn_off", self.route_turn_off)
 
-    async def route_get_state(self, request):
-        data = await self.state_json()
-        return web.Response(text=data)
-
     async def route_turn_on(self, request):
         query = parse.parse_qs(request.query_string)
         await self.set_state_from_query(True, query)
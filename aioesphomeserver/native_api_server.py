@@ -4,6 +4,8 @@ import asyncio
 import socket
 import logging
 
+from collections import deque
+
 from . import (  # type: ignore
     BasicEntity,
     ConnectRequest,
@@ -16,9 +18,7 @@ from . import (  # type: ignore
     GetTimeResponse,
     HelloRequest,
     HelloResponse,
-    ListEntitiesDoneResponse,
     ListEntitiesRequest,
-    MESSAGE_TYPE_TO_PROTO,
     PingRequest,
     PingResponse,
     SubscribeHomeAssistantStatesRequest,
@@ -28,41 +28,94 @@ from . import (  # type: ignore
     SubscribeStatesRequest,
 )
 
-PROTO_TO_MESSAGE_TYPE = {v: k for k, v in MESSAGE_TYPE_TO_PROTO.items()}
+from .logger import LOG_LEVEL_NONE, LOG_LEVEL_VERY_VERBOSE
+from .scheduler import get_scheduler
+
+from .encryption import NoiseFrameHelper
+from .framing import (
+    PROTO_TO_MESSAGE_TYPE,
+    PlaintextFrameHelper,
+    ProtocolError,
+    READ_BUFFER_SIZE,
+    encode_plaintext_frame,
+    message_to_packet,
+)
 
 logger = logging.getLogger(__name__)
 
-def _varuint_to_bytes(value: int) -> bytes:
-    """Convert a varuint to bytes."""
-    if value <= 0x7F:
-        return bytes((value,))
-
-    result = bytearray()
-    while value:
-        temp = value & 0x7F
-        value >>= 7
-        if value:
-            result.append(temp | 0x80)
-        else:
-            result.append(temp)
-    return bytes(result)
+DEFAULT_WRITE_HIGH_WATERMARK = 256 * 1024
+DEFAULT_WRITE_LOW_WATERMARK = 64 * 1024
+DEFAULT_STATE_BUFFER_SIZE = 1024
+DEFAULT_KEEPALIVE_INTERVAL = 30.0
+DEFAULT_KEEPALIVE_TIMEOUT = 10.0
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_LATEST = "latest"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_LATEST, OVERFLOW_DISCONNECT)
+
+PING_PACKET = (PROTO_TO_MESSAGE_TYPE[PingRequest], b"")
 
 class NativeApiConnection:
-    def __init__(self, server, reader, writer):
+    def __init__(
+            self,
+            server,
+            reader,
+            writer,
+            write_high_watermark=DEFAULT_WRITE_HIGH_WATERMARK,
+            write_low_watermark=DEFAULT_WRITE_LOW_WATERMARK,
+            state_buffer_size=DEFAULT_STATE_BUFFER_SIZE,
+            overflow_policy=OVERFLOW_LATEST,
+            coalesce_states=False,
+            state_flush_interval=None,
+            keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL,
+            keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+    ):
         self.server = server
         self.reader = reader
         self.writer = writer
+        self.frame_helper = server.build_frame_helper(self)
         self.subscribe_to_logs = False
+        self.log_level = LOG_LEVEL_NONE
         self.subscribe_to_states = False
         self.running = True
+        self.peer_closed = False
+
+        self.write_high_watermark = write_high_watermark
+        self.write_low_watermark = write_low_watermark
+        self._outbound = []
+        self._outbound_size = 0
+        self._outbound_ready = asyncio.Event()
+        self._frames_ready = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+        self.state_buffer_size = state_buffer_size
+        self.overflow_policy = overflow_policy
+        self.coalesce_states = coalesce_states
+        self.state_flush_interval = state_flush_interval
+        self._pending_states = {} if coalesce_states else deque()
+        self._state_limit = state_buffer_size
+        self._draining = False
+        self._last_state_flush = 0.0
+        self.dropped_states = 0
+        self.collapsed_states = 0
+        self.dropped_logs = 0
+
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_timeout = keepalive_timeout
+        self._awaiting_pong = False
+        self._scheduler = None
 
     async def start(self):
+        self._scheduler = get_scheduler()
+        self.touch()
         while self.running:
             try:
-                heartbeat_task = asyncio.create_task(self.heartbeat())
+                writer_task = asyncio.create_task(self.write_outbound())
                 while self.running:
-                    await self.handle_next_message()
-            except ConnectionResetError:
+                    await self.handle_next_messages()
+            except ConnectionError:
                 logger.warning("Connection reset. Attempting to reconnect...")
                 await self.handle_connection_reset()
             except asyncio.CancelledError:
@@ -72,51 +125,66 @@ class NativeApiConnection:
                 logger.error(f"Unexpected error in connection: {e}", exc_info=True)
                 await asyncio.sleep(5)  # Wait before retrying
             finally:
-                heartbeat_task.cancel()
+                writer_task.cancel()
                 try:
-                    await heartbeat_task
+                    await writer_task
                 except asyncio.CancelledError:
                     pass
 
-    async def heartbeat(self):
-        while self.running:
-            try:
-                await asyncio.wait_for(self.write_message(PingRequest()), timeout=5.0)
-                await asyncio.sleep(30)  # Send heartbeat every 30 seconds
-            except asyncio.TimeoutError:
-                logger.warning("Heartbeat timed out, attempting to reconnect...")
-                await self.handle_connection_reset()
-            except Exception as e:
-                logger.error(f"Heartbeat failed: {e}")
-                await self.handle_connection_reset()
+        self._scheduler.cancel(self)
 
-    async def handle_next_message(self):
-        try:
-            msg = await self.read_next_message()
+    def touch(self):
+        # Inbound traffic proves the peer is alive, so only idle
+        # connections ever get pinged.
+        self._awaiting_pong = False
+        if self.keepalive_interval:
+            self._scheduler.schedule(self, self.keepalive_interval, self._keepalive)
 
-            if msg is None:
-                return
+    def _keepalive(self):
+        if not self.running:
+            return
 
-            await self.server.log(f"{type(msg)}: {msg}")
-
-            if type(msg) == HelloRequest:
-                await self.handle_hello(msg)
-            elif type(msg) == ConnectRequest:
-                await self.handle_connect(msg)
-            elif type(msg) == DisconnectRequest:
-                await self.handle_disconnect(msg)
-            elif type(msg) == SubscribeLogsRequest:
-                await self.handle_subscribe_logs(msg)
-            elif type(msg) == PingRequest:
-                await self.handle_ping(msg)
-            elif type(msg) == SubscribeStatesRequest:
-                await self.handle_subscribe_states(msg)
+        if self._awaiting_pong or not self.frame_helper.ready:
+            if self._awaiting_pong:
+                logger.warning("No response to keepalive ping, closing connection")
             else:
-                await self.server.handle_client_request(self, msg)
-        except asyncio.IncompleteReadError:
-            logger.warning("Incomplete read. Connection might be closed.")
+                logger.warning("Encryption handshake not completed, closing connection")
+            self.running = False
+            self.writer.transport.abort()
+            return
+
+        self._awaiting_pong = True
+        self.write_frames(self.frame_helper.encode_frames((PING_PACKET,)))
+        self._scheduler.schedule(self, self.keepalive_timeout, self._keepalive)
+
+    async def handle_next_messages(self):
+        try:
+            messages = await self.read_next_messages()
+        except ProtocolError as e:
+            logger.warning(f"Protocol error: {e}")
             raise ConnectionResetError
 
+        for msg in messages:
+            await self.handle_message(msg)
+
+    async def handle_message(self, msg):
+        await self.server.log("%s: %s", type(msg), msg)
+
+        if type(msg) == HelloRequest:
+            await self.handle_hello(msg)
+        elif type(msg) == ConnectRequest:
+            await self.handle_connect(msg)
+        elif type(msg) == DisconnectRequest:
+            await self.handle_disconnect(msg)
+        elif type(msg) == SubscribeLogsRequest:
+            await self.handle_subscribe_logs(msg)
+        elif type(msg) == PingRequest:
+            await self.handle_ping(msg)
+        elif type(msg) == SubscribeStatesRequest:
+            await self.handle_subscribe_states(msg)
+        else:
+            await self.server.handle_client_request(self, msg)
+
     async def handle_hello(self, msg):
         resp = HelloResponse(api_version_major=1, api_version_minor=10)
         await self.write_message(resp)
@@ -132,6 +200,9 @@ class NativeApiConnection:
 
     async def handle_subscribe_logs(self, msg):
         self.subscribe_to_logs = True
+        # Clients that don't ask for a level get everything
+        self.log_level = msg.level or LOG_LEVEL_VERY_VERBOSE
+        self.server.update_log_subscription()
 
         resp = SubscribeLogsResponse()
         resp.level = msg.level
@@ -148,68 +219,206 @@ class NativeApiConnection:
         resp = PingResponse()
         await self.write_message(resp)
 
-    async def log(self, message):
-        resp = SubscribeLogsResponse()
-        resp.message = str.encode(message)
+    async def read_next_messages(self):
+        try:
+            data = await self.reader.read(READ_BUFFER_SIZE)
+        except ConnectionError:
+            self.peer_closed = True
+            raise
+        if not data:
+            logger.warning("Connection closed by peer.")
+            self.peer_closed = True
+            raise ConnectionResetError
 
-        await self.write_message(resp)
+        self.touch()
+        return self.frame_helper.feed(data)
 
-    async def read_next_message(self):
-        preamble = await self._read_varuint()
-        length = await self._read_varuint()
-        message_type = await self._read_varuint()
+    async def write_message(self, msg):
+        if msg is None:
+            return
 
-        klass = MESSAGE_TYPE_TO_PROTO.get(message_type)
-        if klass is None:
-            return None
+        self.write_frames(self.frame_helper.encode_frames((message_to_packet(msg),)))
 
-        msg = klass()
-        msg_bytes = await self.reader.read(length)
+        if not self._writable.is_set():
+            await self._writable.wait()
 
-        msg.MergeFromString(msg_bytes)
+    @property
+    def writable(self):
+        return self._writable.is_set()
 
-        return msg
+    async def write_packets(self, packets, plaintext_frame=None):
+        if plaintext_frame is None or self.frame_helper.encrypted:
+            self.write_frames(self.frame_helper.encode_frames(packets))
+        else:
+            self.write_frame(plaintext_frame)
+
+        if not self._writable.is_set():
+            await self._writable.wait()
+
+    def write_frame(self, frame):
+        self._outbound.append(frame)
+        self._outbound_added(len(frame))
+
+    def write_frames(self, frames):
+        self._outbound.extend(frames)
+        self._outbound_added(sum(map(len, frames)))
+
+    def _outbound_added(self, size):
+        self._outbound_size += size
+        if self._outbound_size >= self.write_high_watermark:
+            self._writable.clear()
+        self._outbound_ready.set()
+        self._frames_ready.set()
+
+    def queue_state(self, key, frame):
+        # frame is a packet on encrypted connections, it gets encrypted
+        # at flush time so nonces follow the order frames hit the wire
+        if not self.running:
+            return
 
-    async def write_message(self, msg):
-        if msg is None:
+        pending = self._pending_states
+        if self.coalesce_states and key in pending:
+            # Only the newest state per entity is ever sent
+            pending[key] = frame
+            self.collapsed_states += 1
+            self.server.collapsed_states += 1
             return
 
-        try:
-            out: list[bytes] = []
-            type_: int = PROTO_TO_MESSAGE_TYPE[type(msg)]
-            data = msg.SerializeToString()
+        # Collapsing keeps every entity's newest state so it may happen any
+        # time, dropping or disconnecting only once the client is behind.
+        if len(pending) >= self._state_limit and (self._draining or self.overflow_policy == OVERFLOW_LATEST):
+            self._handle_state_overflow()
+            if not self.running:
+                return
 
-            out.append(b"\0")
-            out.append(_varuint_to_bytes(len(data)))
-            out.append(_varuint_to_bytes(type_))
-            out.append(data)
+        if self.coalesce_states:
+            pending[key] = frame
+        else:
+            pending.append((key, frame))
+        self._outbound_ready.set()
+
+    def _handle_state_overflow(self):
+        pending = self._pending_states
+
+        if self.overflow_policy == OVERFLOW_DISCONNECT:
+            logger.warning("Client is not keeping up with state changes, disconnecting.")
+            self.server.overflow_disconnects += 1
+            self.running = False
+            self._release_writers()
+            self.writer.close()
+            return
+
+        if self.coalesce_states:
+            # Already one state per entity, dropping one would leave that
+            # entity stale until it changes again
+            return
 
-            self.writer.write(b"".join(out))
+        if self.overflow_policy == OVERFLOW_LATEST:
+            latest = {}
+            for key, frame in pending:
+                latest.pop(key, None)
+                latest[key] = frame
+            collapsed = len(pending) - len(latest)
+            pending.clear()
+            pending.extend(latest.items())
+            self.collapsed_states += collapsed
+            self.server.collapsed_states += collapsed
+            # More entities changed than the buffer holds, let it grow
+            # rather than collapsing again on every new state
+            self._state_limit = max(self.state_buffer_size, 2 * len(pending))
+            return
+
+        pending.popleft()
+        self.dropped_states += 1
+        self.server.dropped_states += 1
+
+    async def write_outbound(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await self._outbound_ready.wait()
+            self._outbound_ready.clear()
+
+            include_states = True
+            if self.state_flush_interval and self._pending_states:
+                # Hold states to the configured cadence, but wake up for any
+                # control response or log line queued in the meantime
+                delay = self._last_state_flush + self.state_flush_interval - loop.time()
+                if delay > 0 and not self._outbound:
+                    self._frames_ready.clear()
+                    try:
+                        await asyncio.wait_for(self._frames_ready.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    delay = self._last_state_flush + self.state_flush_interval - loop.time()
+                if delay > 0:
+                    include_states = False
+                    self._outbound_ready.set()
+
+            try:
+                await self.flush(include_states)
+            except ConnectionError:
+                # Closing the transport wakes the reader, which handles the reset
+                self.writer.close()
+                break
+
+    async def flush(self, include_states=True):
+        include_states = include_states and bool(self._pending_states)
+        if not self._outbound and not include_states:
+            return
+
+        frames = self._outbound
+        self._outbound = []
+        size = sum(len(frame) for frame in frames)
+
+        if include_states:
+            if self.coalesce_states:
+                states = self._pending_states.values()
+            else:
+                states = [frame for _key, frame in self._pending_states]
+            if self.frame_helper.encrypted:
+                frames.extend(self.frame_helper.encode_frames(states))
+            else:
+                frames.extend(states)
+            self._pending_states.clear()
+            self._state_limit = self.state_buffer_size
+            self._last_state_flush = asyncio.get_running_loop().time()
+
+        try:
+            self.writer.writelines(frames)
+            self._draining = True
             await self.writer.drain()
-        except ConnectionResetError:
+        except ConnectionError:
             logger.warning("Connection reset while writing message.")
+            self._release_writers()
             raise
+        finally:
+            self._draining = False
+
+        self._outbound_size = max(0, self._outbound_size - size)
+        if self._outbound_size <= self.write_low_watermark:
+            self._writable.set()
 
-    async def _read_varuint(self):
-        result = 0
-        bitpos = 0
-        while not self.reader.at_eof():
-            val_byte = await self.reader.read(1)
-            if len(val_byte) != 1:
-                return -1
-
-            val = val_byte[0]
-            result |= (val & 0x7F) << bitpos
-            if (val & 0x80) == 0:
-                return result
-            bitpos += 7
-        return -1
+    def _release_writers(self):
+        self._outbound.clear()
+        self._pending_states.clear()
+        self._outbound_size = 0
+        self._writable.set()
+        self._outbound_ready.set()
+        self._frames_ready.set()
 
     async def handle_connection_reset(self):
         logger.info("Connection reset detected. Closing connection.")
         
         try:
-            await self.handle_disconnect(DisconnectRequest())
+            if self.peer_closed:
+                # Nobody is left to read a DisconnectResponse
+                self.running = False
+                self._release_writers()
+            elif self.frame_helper.ready:
+                await self.handle_disconnect(DisconnectRequest())
+            else:
+                # Still flushes a handshake error to the client
+                await self.stop()
         except Exception as e:
             logger.error(f"Error during disconnect handling: {e}", exc_info=True)
 
@@ -222,43 +431,139 @@ class NativeApiConnection:
         except Exception as e:
             logger.error(f"Error closing writer: {e}", exc_info=True)
 
-        # The connection will be removed from self._clients in the clean_stale_connections task
+        # handle_client removes the connection from the server once start() returns
         self.running = False
 
     async def stop(self):
         self.running = False
+        try:
+            if not self.writer.is_closing():
+                await self.flush()
+        except ConnectionError:
+            pass
+        self._release_writers()
         self.writer.close()
-        await self.writer.wait_closed()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
 
 class NativeApiServer(BasicEntity):
-    def __init__(self, *args, port=6053, **kwargs):
+    def __init__(
+            self,
+            *args,
+            port=6053,
+            write_high_watermark=DEFAULT_WRITE_HIGH_WATERMARK,
+            write_low_watermark=DEFAULT_WRITE_LOW_WATERMARK,
+            state_buffer_size=DEFAULT_STATE_BUFFER_SIZE,
+            overflow_policy=OVERFLOW_LATEST,
+            coalesce_states=False,
+            state_flush_interval=None,
+            keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL,
+            keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+            **kwargs
+    ):
         super().__init__(*args, **kwargs)
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
         self.port = port
+        self.write_high_watermark = write_high_watermark
+        self.write_low_watermark = write_low_watermark
+        self.state_buffer_size = state_buffer_size
+        self.overflow_policy = overflow_policy
+        self.coalesce_states = coalesce_states
+        self.state_flush_interval = state_flush_interval
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_timeout = keepalive_timeout
+        self.dropped_states = 0
+        self.collapsed_states = 0
+        self.overflow_disconnects = 0
         self._clients = set()
+        self.log_level = LOG_LEVEL_NONE
         self.server = None
 
+    @property
+    def client_count(self):
+        return len(self._clients)
+
     async def run(self):
-        self.server = await asyncio.start_server(self.handle_client, '0.0.0.0', self.port)
-        clean_task = asyncio.create_task(self.clean_stale_connections())
-        try:
-            await self.device.log(2, "api", f"starting on port {self.port}!")
-            async with self.server:
-                await self.server.serve_forever()
-        finally:
-            clean_task.cancel()
+        profile = self.device.runtime_profile
+        self.server = await asyncio.start_server(
+            self.handle_client, '0.0.0.0', self.port, **profile.server_options()
+        )
+        for sock in self.server.sockets:
+            profile.configure_listener(sock)
+        await self.device.log(2, "api", f"starting on port {self.port}!")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def log(self, message, *args):
+        if self.log_level < LOG_LEVEL_VERY_VERBOSE:
+            return
 
-    async def log(self, message):
+        if args:
+            message = message % args
+
+        self.send_log(LOG_LEVEL_VERY_VERBOSE, message)
+
+    def send_log(self, level, message):
+        if level > self.log_level:
+            return
+
+        packet = frame = None
         for client in self._clients:
-            if client.subscribe_to_logs:
-                await client.log(message)
+            if client.subscribe_to_logs and level <= client.log_level:
+                if not client.writable:
+                    # Log lines are not worth stalling or buffering for
+                    client.dropped_logs += 1
+                    continue
+                if packet is None:
+                    packet = message_to_packet(
+                        SubscribeLogsResponse(level=level, message=str.encode(message))
+                    )
+                if client.frame_helper.encrypted:
+                    client.write_frames(client.frame_helper.encode_frames((packet,)))
+                    continue
+                if frame is None:
+                    frame = encode_plaintext_frame(*packet)
+                client.write_frame(frame)
+
+    def update_log_subscription(self):
+        level = max(
+            (client.log_level for client in self._clients if client.subscribe_to_logs),
+            default=LOG_LEVEL_NONE,
+        )
+        self.log_level = level
+        self.device.set_log_subscription(self, level)
+
+    def build_frame_helper(self, connection):
+        psk = self.device.noise_psk
+        if psk is None:
+            return PlaintextFrameHelper()
+        return NoiseFrameHelper(psk, self.device.name, connection.write_frame)
 
     async def handle_client(self, reader, writer):
-        connection = NativeApiConnection(self, reader, writer)
+        self.device.runtime_profile.configure_connection(writer.get_extra_info('socket'))
+        connection = NativeApiConnection(
+            self,
+            reader,
+            writer,
+            write_high_watermark=self.write_high_watermark,
+            write_low_watermark=self.write_low_watermark,
+            state_buffer_size=self.state_buffer_size,
+            overflow_policy=self.overflow_policy,
+            coalesce_states=self.coalesce_states,
+            state_flush_interval=self.state_flush_interval,
+            keepalive_interval=self.keepalive_interval,
+            keepalive_timeout=self.keepalive_timeout,
+        )
         self._clients.add(connection)
         try:
             await connection.start()
         finally:
-            self._clients.remove(connection)
+            self._clients.discard(connection)
+            self.update_log_subscription()
 
     async def handle_client_request(self, client, message):
         if type(message) == SubscribeHomeassistantServicesRequest:
@@ -270,43 +575,51 @@ class NativeApiServer(BasicEntity):
         elif type(message) == DeviceInfoRequest:
             await self.handle_device_info(client)
         else:
-            await self.device.publish(self, 'client_request', message)
+            await self.device.route_command(self, message)
 
     async def handle_list_entities(self, client, message):
-        for entity in self.device.entities:
-            msg = await entity.build_list_entities_response()
-            if msg != None:
-                await client.write_message(msg)
-
-        done_msg = ListEntitiesDoneResponse()
-        await client.write_message(done_msg)
+        packets, frame = await self.device.build_list_entities_packets()
+        await client.write_packets(packets, frame)
 
     async def handle_device_info(self, client):
         msg = await self.device.build_device_info_response()
         await client.write_message(msg)
 
     async def send_all_states(self, client):
-        for entity in self.device.entities:
-            msg = await entity.build_state_response()
-            if msg == None:
-                continue
-            await client.write_message(msg)
+        packets, frame = await self.device.state_snapshot.build_packets()
+        await client.write_packets(packets, frame)
+
+    def subscriptions(self):
+        return [
+            ('state_change', None, None),
+            ('state_changes', None, None),
+            ('log', None, None),
+        ]
+
+    def queue_state(self, message):
+        # Serialized once for every client, plaintext clients also share the frame
+        packet = frame = None
+        for client in self._clients:
+            if client.subscribe_to_states and client.running:
+                if packet is None:
+                    packet = message_to_packet(message)
+                if client.frame_helper.encrypted:
+                    client.queue_state(message.key, packet)
+                    continue
+                if frame is None:
+                    frame = encode_plaintext_frame(*packet)
+                client.queue_state(message.key, frame)
 
     async def handle(self, key, message):
         if key == 'state_change':
-            for client in self._clients:
-                if client.subscribe_to_states:
-                    await client.write_message(message)
+            self.queue_state(message)
 
-        if key == 'log':
-            msg = SubscribeLogsResponse(
-                level = message[0],
-                message = str.encode(message[1])
-            )
+        if key == 'state_changes':
+            for state in message:
+                self.queue_state(state)
 
-            for client in self._clients:
-                if client.subscribe_to_logs:
-                    await client.write_message(msg)
+        if key == 'log':
+            self.send_log(message[0], message[1])
 
     async def stop(self):
         if self.server:
@@ -319,10 +632,3 @@ class NativeApiServer(BasicEntity):
     async def restart(self):
         await self.stop()
         await self.run()
-
-    async def clean_stale_connections(self):
-        while True:
-            for client in list(self._clients):
-                if client.writer.is_closing():
-                    self._clients.remove(client)
-            await asyncio.sleep(60)  # Run every minute
\ No newline at end of file
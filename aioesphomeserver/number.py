@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-import json
-
 from . import (
     BasicEntity,
+    FilterChain,
     NumberStateResponse,
     ListEntitiesNumberResponse,
 )
@@ -11,6 +10,16 @@ from . import (
 class NumberEntity(BasicEntity):
     DOMAIN = "number"
 
+    __slots__ = (
+        "min_value",
+        "max_value",
+        "step",
+        "unit_of_measurement",
+        "mode",
+        "_raw_state",
+        "_filters",
+    )
+
     def __init__(
             self,
             *args,
@@ -19,6 +28,9 @@ class NumberEntity(BasicEntity):
             step=None,
             unit_of_measurement=None,
             mode=None,
+            filters=None,
+            deadband=None,
+            deadband_percent=None,
             **kwargs
     ):
         super().__init__(*args, **kwargs)
@@ -28,6 +40,9 @@ class NumberEntity(BasicEntity):
         self.unit_of_measurement = unit_of_measurement
         self.mode = mode
         self._state = 0.0
+        self._raw_state = 0.0
+        self._filters = FilterChain(filters, self.publish_state) if filters else None
+        self.set_deadband(deadband, deadband_percent)
 
     async def build_list_entities_response(self):
         return ListEntitiesNumberResponse(
@@ -50,7 +65,7 @@ class NumberEntity(BasicEntity):
             state=await self.get_state()
         )
 
-    async def state_json(self):
+    async def build_state_json(self):
         state = await self.get_state()
 
         data = {
@@ -58,18 +73,46 @@ class NumberEntity(BasicEntity):
             "name": self.name,
             "state": state,
         }
-        return json.dumps(data)
+        return data
+
+    @property
+    def raw_state(self):
+        return self._raw_state if self._filters is not None else self._state
+
+    def deadband_value(self):
+        return self._state
 
     async def get_state(self):
         return self._state
 
     async def set_state(self, val):
-        await self.device.log(3, self.DOMAIN, f"[{self.object_id}] Setting value to {val}")
+        if self._filters is not None:
+            self._raw_state = val
+            val = self._filters.push(val)
+            if val is None:
+                return
+        await self.publish_state(val)
+
+    async def publish_state(self, val):
+        await self.device.log(3, self.DOMAIN, "[%s] Setting value to %s", self.object_id, val)
         old_state = self._state
         self._state = val
         if val != old_state:
             await self.notify_state_change()
 
+    async def notify_state_change(self):
+        if self.in_deadband(self._state):
+            self.suppress_state_change()
+            return
+        await super().notify_state_change()
+
+    async def handle_web_command(self, action, params):
+        if action != "set":
+            await super().handle_web_command(action, params)
+            return
+
+        await self.set_state(float(params["value"]))
+
 # Example usage
 if __name__ == "__main__":
     import asyncio
@@ -78,8 +121,8 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
     class TestDevice:
-        async def log(self, level, domain, message):
-            logging.log(level, message)
+        async def log(self, level, domain, message, *args):
+            logging.log(level, message, *args)
 
         async def notify_state_change(self):
             logging.info("State changed")
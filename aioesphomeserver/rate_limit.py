@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+class PublishLimiter:
+    """Bounds how often an entity's state changes are published.
+
+    min_interval holds changes back so at most one is published per interval,
+    with the latest state going out once the interval has passed.
+    max_interval republishes the current state if nothing was published for
+    that long. deadband/deadband_percent drop numeric changes smaller than
+    that from the last published value.
+    """
+
+    __slots__ = (
+        "min_interval",
+        "max_interval",
+        "deadband",
+        "deadband_percent",
+        "published_value",
+        "_last_publish",
+        "_trailing",
+        "_heartbeat",
+        "_task",
+    )
+
+    def __init__(self, min_interval=None, max_interval=None, deadband=None, deadband_percent=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.published_value = None
+        self._last_publish = None
+        self._trailing = None
+        self._heartbeat = None
+        self._task = None
+
+    def in_deadband(self, value):
+        published = self.published_value
+        if published is None or value is None:
+            return False
+
+        diff = abs(value - published)
+        if self.deadband is not None and diff < self.deadband:
+            return True
+        if self.deadband_percent is not None and diff < abs(published) * self.deadband_percent / 100:
+            return True
+        return False
+
+    def hold(self, entity):
+        if not self.min_interval:
+            return False
+        if self._trailing is not None:
+            return True
+        if self._last_publish is None:
+            return False
+
+        wait = self._last_publish + self.min_interval - time.monotonic()
+        if wait <= 0:
+            return False
+
+        self._trailing = asyncio.get_running_loop().call_later(wait, self._fire, entity)
+        return True
+
+    def published(self, entity):
+        self._last_publish = time.monotonic()
+        self.published_value = entity.deadband_value()
+
+        if self._trailing is not None:
+            self._trailing.cancel()
+            self._trailing = None
+
+        if self.max_interval:
+            if self._heartbeat is not None:
+                self._heartbeat.cancel()
+            self._heartbeat = asyncio.get_running_loop().call_later(self.max_interval, self._fire, entity)
+
+    def _fire(self, entity):
+        self.cancel()
+        self._task = asyncio.get_running_loop().create_task(entity.publish_state_change())
+
+    def cancel(self):
+        for handle in (self._trailing, self._heartbeat):
+            if handle is not None:
+                handle.cancel()
+        self._trailing = None
+        self._heartbeat = None
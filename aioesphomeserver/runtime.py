@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+from types import ModuleType
+
+uvloop: ModuleType | None
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+class RuntimeProfile:
+    """Event loop and socket settings for running devices.
+
+    use_uvloop: run on uvloop when it is installed (pip install
+        aioesphomeserver[speedups]). Only takes effect when the loop is
+        created through run().
+    eager_tasks: use asyncio.eager_task_factory (Python 3.12+), so tasks
+        that finish without blocking never go through the scheduler.
+    tcp_nodelay: disable Nagle's algorithm on API connections so small
+        responses aren't delayed waiting for more data. The event loop
+        already disables it on TCP transports, so False turns Nagle back on.
+    send_buffer_size, recv_buffer_size: SO_SNDBUF/SO_RCVBUF for the API
+        listener and its connections, None keeps the OS default.
+    backlog: listen() backlog of the API server.
+    """
+
+    def __init__(
+            self,
+            use_uvloop=False,
+            eager_tasks=False,
+            tcp_nodelay=True,
+            send_buffer_size=None,
+            recv_buffer_size=None,
+            backlog=100,
+    ):
+        self.use_uvloop = use_uvloop
+        self.eager_tasks = eager_tasks
+        self.tcp_nodelay = tcp_nodelay
+        self.send_buffer_size = send_buffer_size
+        self.recv_buffer_size = recv_buffer_size
+        self.backlog = backlog
+
+    def __repr__(self):
+        return (
+            f"RuntimeProfile(use_uvloop={self.use_uvloop}, eager_tasks={self.eager_tasks}, "
+            f"tcp_nodelay={self.tcp_nodelay}, send_buffer_size={self.send_buffer_size}, "
+            f"recv_buffer_size={self.recv_buffer_size}, backlog={self.backlog})"
+        )
+
+    def loop_factory(self):
+        if self.use_uvloop and uvloop is not None:
+            return uvloop.new_event_loop
+        return None
+
+    def run(self, main):
+        """Run the coroutine main on a new event loop set up for this profile."""
+        with asyncio.Runner(loop_factory=self.loop_factory()) as runner:
+            return runner.run(main)
+
+    def configure_loop(self, loop):
+        if self.use_uvloop and uvloop is not None and not isinstance(loop, uvloop.Loop):
+            logger.warning("Runtime profile wants uvloop but the loop was not created by RuntimeProfile.run()")
+
+        if self.eager_tasks and hasattr(asyncio, "eager_task_factory"):
+            loop.set_task_factory(asyncio.eager_task_factory)
+
+    def server_options(self):
+        return {"backlog": self.backlog}
+
+    def _set_buffer_sizes(self, sock):
+        if self.send_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size)
+        if self.recv_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+
+    def configure_listener(self, sock):
+        # Accepted sockets inherit the listener's buffer sizes on Linux,
+        # configure_connection sets them again for everyone else.
+        self._set_buffer_sizes(sock)
+
+    def configure_connection(self, sock):
+        if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+            return
+        # Set either way, the event loop has already enabled it
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.tcp_nodelay else 0)
+        self._set_buffer_sizes(sock)
+
+DEFAULT_RUNTIME_PROFILE = RuntimeProfile()
+
+LOW_LATENCY_RUNTIME_PROFILE = RuntimeProfile(
+    use_uvloop=True,
+    eager_tasks=True,
+    tcp_nodelay=True,
+    send_buffer_size=256 * 1024,
+    recv_buffer_size=256 * 1024,
+)
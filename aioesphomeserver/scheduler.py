@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import weakref
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESOLUTION = 0.25
+
+class TimerScheduler:
+    """Drives many timers from a single heap and one pending loop callback.
+
+    Each timer is identified by a key (e.g. a connection) and has at most one
+    deadline. Pushing a deadline back, which happens on every inbound packet
+    for keepalives, only updates a dict entry; the old heap entry is re-queued
+    when it comes due. Wakeups are rounded up to `resolution` seconds so
+    timers that expire close together fire in one pass.
+    """
+
+    def __init__(self, loop, resolution=DEFAULT_RESOLUTION):
+        self.loop = loop
+        self.resolution = resolution
+        self._deadlines = {}
+        self._queued = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._handle = None
+        self._armed_at = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay, callback):
+        deadline = self.loop.time() + delay
+        self._deadlines[key] = (deadline, callback)
+
+        queued = self._queued.get(key)
+        if queued is None or deadline < queued:
+            self._push(key, deadline)
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+
+    def _push(self, key, deadline):
+        self._queued[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if self._armed_at is None or deadline < self._armed_at:
+            self._arm(deadline)
+
+    def _arm(self, deadline):
+        if self._handle is not None:
+            self._handle.cancel()
+        when = math.ceil(deadline / self.resolution) * self.resolution
+        self._armed_at = when
+        self._handle = self.loop.call_at(when, self._run)
+
+    def _run(self):
+        self._handle = None
+        self._armed_at = None
+        heap = self._heap
+        now = self.loop.time()
+
+        while heap and heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(heap)
+            if self._queued.get(key) != deadline:
+                # Superseded by an earlier deadline that was pushed later
+                continue
+            del self._queued[key]
+
+            entry = self._deadlines.get(key)
+            if entry is None:
+                continue
+            if entry[0] > now:
+                self._push(key, entry[0])
+                continue
+
+            del self._deadlines[key]
+            try:
+                entry[1]()
+            except Exception as e:
+                logger.error(f"Error in timer callback for {key!r}: {e}", exc_info=True)
+
+        if heap and self._handle is None:
+            self._arm(heap[0][0])
+
+_schedulers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TimerScheduler] = weakref.WeakKeyDictionary()
+
+def get_scheduler():
+    """The TimerScheduler shared by everything on the running event loop."""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = TimerScheduler(loop)
+    return scheduler
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-import json
-
 from . import (
     BasicEntity,
+    FilterChain,
     SensorStateResponse,
     ListEntitiesSensorResponse,
 )
@@ -11,12 +10,24 @@ from . import (
 class SensorEntity(BasicEntity):
     DOMAIN = "sensor"
 
+    __slots__ = (
+        "unit_of_measurement",
+        "accuracy_decimals",
+        "state_class",
+        "_store",
+        "_raw_state",
+        "_filters",
+    )
+
     def __init__(
             self,
             *args,
             unit_of_measurement=None,
             accuracy_decimals=None,
             state_class=None,
+            filters=None,
+            deadband=None,
+            deadband_percent=None,
             **kwargs
     ):
         super().__init__(*args, **kwargs)
@@ -24,6 +35,23 @@ class SensorEntity(BasicEntity):
         self.accuracy_decimals = accuracy_decimals
         self.state_class = state_class
         self._state = 0.0
+        self._store = None
+        self._raw_state = 0.0
+        self._filters = FilterChain(filters, self.publish_state) if filters else None
+        self.set_deadband(deadband, deadband_percent)
+
+    def attach_store(self, store):
+        # The value moves into the device's array, the entity becomes a view on it
+        if store.attach(self.key, self._state):
+            self._store = store
+            self._state = None
+
+    def detach_store(self):
+        if self._store is None:
+            return
+        self._state = self._store.values[self.key]
+        self._store.release(self.key)
+        self._store = None
 
     async def build_list_entities_response(self):
         return ListEntitiesSensorResponse(
@@ -45,7 +73,7 @@ class SensorEntity(BasicEntity):
             state = await self.get_state()
         )
 
-    async def state_json(self):
+    async def build_state_json(self):
         state = await self.get_state()
 
         data = {
@@ -53,14 +81,52 @@ class SensorEntity(BasicEntity):
             "name": self.name,
             "state": state,
         }
-        return json.dumps(data)
+        return data
 
-    async def get_state(self):
+    @property
+    def value(self):
+        if self._store is not None:
+            return self._store.values[self.key]
         return self._state
 
+    @value.setter
+    def value(self, val):
+        if self._store is not None:
+            self._store.values[self.key] = val
+        else:
+            self._state = val
+
+    @property
+    def raw_state(self):
+        # Without filters the raw and published values are the same
+        return self._raw_state if self._filters is not None else self.value
+
+    def filter_value(self, val):
+        if self._filters is None:
+            return val
+        self._raw_state = val
+        return self._filters.push(val)
+
+    def deadband_value(self):
+        return self.value
+
+    async def get_state(self):
+        return self.value
+
     async def set_state(self, val):
-        await self.device.log(3, self.DOMAIN, f"[{self.object_id}] Setting value to {val}")
-        old_state = self._state
-        self._state = val
-        if val != old_state:
+        val = self.filter_value(val)
+        if val is not None:
+            await self.publish_state(val)
+
+    async def publish_state(self, val):
+        await self.device.log(3, self.DOMAIN, "[%s] Setting value to %s", self.object_id, val)
+        old_state = self.value
+        self.value = val
+        if self.value != old_state:
             await self.notify_state_change()
+
+    async def notify_state_change(self):
+        if self.in_deadband(self.value):
+            self.suppress_state_change()
+            return
+        await super().notify_state_change()
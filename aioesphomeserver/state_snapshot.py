@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from .framing import encode_plaintext_frames, message_to_packet
+
+class StateSnapshot:
+    """Latest state of every entity on a device, kept ready to send.
+
+    Entities update it from notify_state_change, so a new API or web
+    subscriber gets the current states without walking every entity.
+    JSON documents are only built when a web client asks for them.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self._packets = {}
+        self._json = {}
+        self._stale = set()
+        self._loaded = False
+        self._cache = None
+
+    def update(self, entity, message):
+        self._json.pop(entity.key, None)
+        self._cache = None
+        if not self._loaded:
+            return
+
+        if message is None:
+            self._packets.pop(entity.key, None)
+        else:
+            self._packets[entity.key] = message_to_packet(message)
+        self._stale.discard(entity.key)
+
+    def invalidate(self, entity):
+        self._json.pop(entity.key, None)
+        self._cache = None
+        if self._loaded:
+            self._stale.add(entity.key)
+
+    def remove(self, entity):
+        self._packets.pop(entity.key, None)
+        self._json.pop(entity.key, None)
+        self._stale.discard(entity.key)
+        self._cache = None
+
+    async def _refresh(self):
+        if not self._loaded:
+            for entity in self.device.entities:
+                msg = await entity.build_state_response()
+                if msg is not None:
+                    self._packets[entity.key] = message_to_packet(msg)
+            self._loaded = True
+            self._stale.clear()
+            return
+
+        while self._stale:
+            key = self._stale.pop()
+            entity = self.device.get_entity_by_key(key)
+            msg = None if entity is None else await entity.build_state_response()
+            if msg is None:
+                self._packets.pop(key, None)
+            else:
+                self._packets[key] = message_to_packet(msg)
+
+    async def build_packets(self):
+        if self._cache is None:
+            await self._refresh()
+            packets = list(self._packets.values())
+            self._cache = (packets, encode_plaintext_frames(packets))
+        return self._cache
+
+    async def build_json(self, entities=None):
+        states = []
+        for entity in self.device.entities if entities is None else entities:
+            if entity.key not in self._json:
+                self._json[entity.key] = await entity.state_json()
+            data = self._json[entity.key]
+            if data is not None:
+                states.append(data)
+        return states
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from array import array
+
+# Keys further than this past the end of the array stay out of the store
+# rather than growing it with a long run of unused slots
+MAX_KEY_GAP = 4096
+
+class SensorValueStore:
+    """Columnar storage for sensor values.
+
+    Every attached sensor's value lives at values[entity.key] in a single
+    array('d'), so a device with thousands of channels keeps its values in
+    one contiguous buffer instead of one float object per entity. Indexing
+    by key means sensors don't need an index object of their own; slots
+    of removed sensors and non-sensor keys are left unused, which is cheap
+    since device keys are handed out densely.
+    """
+
+    def __init__(self):
+        self.values = array('d')
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def attach(self, key, value=0.0):
+        values = self.values
+        if key >= len(values):
+            if key - len(values) > MAX_KEY_GAP:
+                return False
+            values.extend(array('d', bytes(8 * (key + 1 - len(values)))))
+        values[key] = value
+        self._count += 1
+        return True
+
+    def release(self, key):
+        self.values[key] = 0.0
+        self._count -= 1
@@ -0,0 +1,460 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import time
+from struct import Struct
+from types import ModuleType
+
+from aiohttp import web
+from aioesphomeapi.core import MESSAGE_TYPE_TO_PROTO
+
+from . import (
+    BasicEntity,
+    DeviceHost,
+    EntityListener,
+)
+from .framing import message_to_packet
+from .runtime import DEFAULT_RUNTIME_PROFILE
+
+resource: ModuleType | None
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where Supervisor can't run anyway
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_INTERVAL = 5.0
+RESTART_DELAY = 5.0
+# Events are dropped rather than buffered without bound for a peer that
+# has stopped reading its pipe
+MAX_EVENT_BACKLOG = 1024 * 1024
+
+_LENGTH = Struct("!I")
+
+def _require_unix_sockets():
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("Supervisor needs Unix domain sockets, which this platform doesn't have")
+
+class _Channel:
+    # Pickled messages over one end of a worker's socketpair. Writes go into
+    # the transport's buffer, so a slow peer never blocks the event loop.
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, conn):
+        _require_unix_sockets()
+        sock = socket.socket(fileno=os.dup(conn.fileno()))
+        conn.close()
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+        return cls(reader, writer)
+
+    @property
+    def backlogged(self):
+        return self.writer.transport.get_write_buffer_size() > MAX_EVENT_BACKLOG
+
+    def send(self, msg):
+        if self.writer.is_closing():
+            return
+        data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+        self.writer.write(_LENGTH.pack(len(data)) + data)
+
+    async def recv(self):
+        (length,) = _LENGTH.unpack(await self.reader.readexactly(_LENGTH.size))
+        return pickle.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        self.writer.close()
+
+class RemoteEntityListener(EntityListener):
+    """An EntityListener for an entity on another device, which may be
+    running in a different worker process.
+
+    handle() is called with 'state_change' messages for the entity with
+    object_id `entity_id` on the device named `remote_device`.
+    """
+
+    __slots__ = ("remote_device",)
+
+    def __init__(self, *args, remote_device=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.remote_device = remote_device
+
+    def subscriptions(self):
+        return []
+
+class _WorkerBridge(BasicEntity):
+    # Forwards state changes of watched entities on one device to the worker
+    __slots__ = ("worker",)
+
+    def __init__(self, worker):
+        super().__init__(name="_worker_bridge")
+        self.worker = worker
+
+    def subscriptions(self):
+        subscriptions = []
+        for object_id in self.worker.watched_entities(self.device.name):
+            entity = self.device.get_entity(object_id)
+            if entity is not None:
+                subscriptions.append(('state_change', None, entity.key))
+        return subscriptions
+
+    async def handle(self, key, message):
+        entity = self.device.get_entity_by_key(message.key)
+        if entity is not None:
+            await self.worker.forward((self.device.name, entity.object_id), message)
+
+class _Worker:
+    def __init__(self, index, assignments, web_port, conn, metrics_interval, runtime_profile):
+        self.index = index
+        self.runtime_profile = runtime_profile
+        self.conn = conn
+        self.channel = None
+        self.metrics_interval = metrics_interval
+        self.host = DeviceHost(web_port=web_port)
+        self.listeners = {}
+        self.remote_watch = set()
+        self.events_sent = 0
+        self.events_received = 0
+        self.events_dropped = 0
+        self._stopped = None
+
+        for factory, api_port in assignments:
+            device = factory()
+            self.host.add_device(device, api_port=api_port)
+            device.add_entity(_WorkerBridge(self))
+
+        for device in self.host.devices.values():
+            for entity in device.entities:
+                if isinstance(entity, RemoteEntityListener):
+                    topic = (entity.remote_device, entity.entity_id)
+                    self.listeners.setdefault(topic, []).append(entity)
+
+    def watched_entities(self, device_name):
+        return [
+            object_id
+            for name, object_id in self.listeners.keys() | self.remote_watch
+            if name == device_name
+        ]
+
+    def _resubscribe(self):
+        for device in self.host.devices.values():
+            device.invalidate_subscriptions()
+
+    def hello(self):
+        return (
+            "hello",
+            os.getpid(),
+            [
+                (device.name, prefix, device.api_port)
+                for prefix, device in self.host.devices.items()
+            ],
+            list(self.listeners),
+        )
+
+    async def forward(self, topic, message):
+        if topic in self.listeners:
+            await self.deliver(topic, message)
+        if topic in self.remote_watch:
+            if self.channel.backlogged:
+                self.events_dropped += 1
+                return
+            self.channel.send(("event", topic, message_to_packet(message)))
+            self.events_sent += 1
+
+    async def deliver(self, topic, message):
+        for listener in self.listeners.get(topic, ()):
+            try:
+                await listener.handle('state_change', message)
+            except Exception as e:
+                logger.error(f"Error delivering {topic} to {listener.name}: {e}", exc_info=True)
+
+    async def read_messages(self):
+        try:
+            while True:
+                self._handle_message(await self.channel.recv())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The supervisor went away
+            self._stopped.set()
+
+    def _handle_message(self, msg):
+        if msg[0] == "watch":
+            self.remote_watch = set(msg[1])
+            self._resubscribe()
+        elif msg[0] == "event":
+            _, topic, (msg_type, data) = msg
+            message = MESSAGE_TYPE_TO_PROTO[msg_type]()
+            message.ParseFromString(data)
+            self.events_received += 1
+            asyncio.get_running_loop().create_task(self.deliver(topic, message))
+        elif msg[0] == "stop":
+            self._stopped.set()
+
+    def metrics(self):
+        devices = {}
+        for device in self.host.devices.values():
+            api_server = device.api_server
+            devices[device.name] = {
+                "entities": len(device.entities),
+                "api_clients": api_server.client_count,
+                "dropped_states": api_server.dropped_states,
+                "rejected_commands": device.rejected_commands,
+            }
+        metrics = {
+            "pid": os.getpid(),
+            "events_sent": self.events_sent,
+            "events_received": self.events_received,
+            "events_dropped": self.events_dropped,
+            "devices": devices,
+        }
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            metrics["cpu_seconds"] = usage.ru_utime + usage.ru_stime
+            metrics["max_rss_kib"] = usage.ru_maxrss
+        return metrics
+
+    async def report_metrics(self):
+        while True:
+            self.channel.send(("metrics", self.metrics()))
+            await asyncio.sleep(self.metrics_interval)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.channel = await _Channel.open(self.conn)
+        self.channel.send(self.hello())
+
+        tasks = [
+            loop.create_task(self.host.run(self.runtime_profile)),
+            loop.create_task(self.report_metrics()),
+            loop.create_task(self.read_messages()),
+        ]
+        try:
+            await self._stopped.wait()
+        finally:
+            self.channel.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+def _run_worker(index, assignments, web_port, conn, metrics_interval, runtime_profile):
+    worker = _Worker(index, assignments, web_port, conn, metrics_interval, runtime_profile)
+    try:
+        (runtime_profile or DEFAULT_RUNTIME_PROFILE).run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+class _WorkerHandle:
+    def __init__(self, index, assignments, web_port):
+        self.index = index
+        self.assignments = assignments
+        self.web_port = web_port
+        self.process = None
+        self.channel = None
+        self.reader_task = None
+        self.pid = None
+        self.devices = []
+        self.interest = []
+        self.metrics = None
+        self.started_at = None
+        self.restarts = 0
+
+class Supervisor:
+    """Spreads devices over a pool of worker processes.
+
+    Each worker runs its share of the devices in a DeviceHost on its own
+    event loop, with its web server on web_port_start + worker index. Device
+    factories are called in the worker, so they must be picklable (e.g.
+    module level functions). RemoteEntityListener events between workers go
+    through the supervisor over a pipe per worker, and the supervisor serves
+    the device list (GET /) and worker metrics (GET /metrics) on
+    management_port. Workers that exit are restarted. Workers create their
+    event loop with runtime_profile, if given.
+    """
+
+    def __init__(
+            self,
+            device_factories,
+            workers=None,
+            api_port_start=6053,
+            web_port_start=8080,
+            management_port=8000,
+            metrics_interval=DEFAULT_METRICS_INTERVAL,
+            runtime_profile=None,
+    ):
+        _require_unix_sockets()
+        self.device_factories = list(device_factories)
+        self.worker_count = max(1, min(workers or os.cpu_count() or 1, len(self.device_factories)))
+        self.management_port = management_port
+        self.metrics_interval = metrics_interval
+        self.runtime_profile = runtime_profile
+        self._context = multiprocessing.get_context("spawn")
+
+        self.workers = [
+            _WorkerHandle(i, [], web_port_start + i)
+            for i in range(self.worker_count)
+        ]
+        for i, factory in enumerate(self.device_factories):
+            self.workers[i % self.worker_count].assignments.append((factory, api_port_start + i))
+
+        self.placement = {}
+        self.events_routed = 0
+        self.events_dropped = 0
+
+    async def _start_worker(self, worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=_run_worker,
+            args=(
+                worker.index,
+                worker.assignments,
+                worker.web_port,
+                child_conn,
+                self.metrics_interval,
+                self.runtime_profile,
+            ),
+            name=f"aioesphomeserver-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.channel = channel = await _Channel.open(parent_conn)
+        worker.started_at = time.time()
+        worker.reader_task = asyncio.get_running_loop().create_task(self._read_messages(worker, channel))
+
+    def _stop_reading(self, worker):
+        # Closing the channel ends its reader task with EOF
+        if worker.channel is not None:
+            worker.channel.close()
+            worker.channel = None
+
+    async def _read_messages(self, worker, channel):
+        try:
+            while True:
+                self._handle_message(worker, await channel.recv())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        if worker.channel is channel:
+            self._stop_reading(worker)
+
+    def _send(self, worker, msg):
+        if worker.channel is not None:
+            worker.channel.send(msg)
+
+    def _handle_message(self, worker, msg):
+        if msg[0] == "hello":
+            _, worker.pid, worker.devices, worker.interest = msg
+            for name, prefix, api_port in worker.devices:
+                self.placement[name] = worker
+            self._update_watches()
+        elif msg[0] == "event":
+            for other in self._interested_workers(worker, msg[1]):
+                if other.channel is not None and other.channel.backlogged:
+                    self.events_dropped += 1
+                    continue
+                self._send(other, msg)
+                self.events_routed += 1
+        elif msg[0] == "metrics":
+            worker.metrics = msg[1]
+
+    def _interested_workers(self, source, topic):
+        return [
+            worker for worker in self.workers
+            if worker is not source and topic in worker.interest
+        ]
+
+    def _update_watches(self):
+        # Tell each worker which of its entities other workers listen to
+        watches = {worker.index: set() for worker in self.workers}
+        for worker in self.workers:
+            for name, object_id in worker.interest:
+                owner = self.placement.get(name)
+                if owner is not None and owner is not worker:
+                    watches[owner.index].add((name, object_id))
+
+        for worker in self.workers:
+            self._send(worker, ("watch", list(watches[worker.index])))
+
+    async def index(self, _request):
+        return web.json_response([
+            {
+                "name": name,
+                "worker": worker.index,
+                "pid": worker.pid,
+                "api_port": api_port,
+                "web_port": worker.web_port,
+                "path": f"/{prefix}/",
+            }
+            for worker in self.workers
+            for name, prefix, api_port in worker.devices
+        ])
+
+    async def route_metrics(self, _request):
+        return web.json_response({
+            "events_routed": self.events_routed,
+            "events_dropped": self.events_dropped,
+            "workers": [
+                {
+                    "index": worker.index,
+                    "alive": worker.process is not None and worker.process.is_alive(),
+                    "restarts": worker.restarts,
+                    "uptime": time.time() - worker.started_at if worker.started_at else None,
+                    "web_port": worker.web_port,
+                    **(worker.metrics or {}),
+                }
+                for worker in self.workers
+            ],
+        })
+
+    async def watch_workers(self):
+        while True:
+            await asyncio.sleep(1)
+            for worker in self.workers:
+                if worker.process.is_alive():
+                    continue
+                logger.warning(f"Worker {worker.index} exited with {worker.process.exitcode}, restarting in {RESTART_DELAY}s")
+                self._stop_reading(worker)
+                await asyncio.sleep(RESTART_DELAY)
+                worker.restarts += 1
+                await self._start_worker(worker)
+
+    async def run(self):
+        for worker in self.workers:
+            await self._start_worker(worker)
+
+        app = web.Application()
+        app.router.add_route("GET", "/", self.index)
+        app.router.add_route("GET", "/metrics", self.route_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', self.management_port).start()
+        logger.info(f"Supervising {len(self.device_factories)} devices in {self.worker_count} workers")
+
+        try:
+            await self.watch_workers()
+        finally:
+            await runner.cleanup()
+            await self.stop()
+
+    async def stop(self):
+        for worker in self.workers:
+            self._send(worker, ("stop",))
+
+        for worker in self.workers:
+            process = worker.process
+            if process is None:
+                continue
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.terminate()
+            self._stop_reading(worker)
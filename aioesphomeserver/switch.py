@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 from aiohttp import web
 
 from aioesphomeapi.api_pb2 import (  # type: ignore
@@ -13,6 +12,9 @@ from .basic_entity import BasicEntity
 
 class SwitchEntity(BasicEntity):
     DOMAIN = "switch"
+    COMMAND_TYPES = (SwitchCommandRequest,)
+
+    __slots__ = ("assumed_state",)
 
     def __init__(
             self,
@@ -47,13 +49,13 @@ class SwitchEntity(BasicEntity):
         return self._state
 
     async def set_state(self, val):
-        await self.device.log(3, self.DOMAIN, f"[{self.object_id}] Setting state to {val}")
+        await self.device.log(3, self.DOMAIN, "[%s] Setting state to %s", self.object_id, val)
         old_state = self._state
         self._state = val
         if val != old_state:
             await self.notify_state_change()
 
-    async def state_json(self):
+    async def build_state_json(self):
         state = await self.get_state()
         state_str = "ON" if state else "OFF"
 
@@ -63,17 +65,23 @@ class SwitchEntity(BasicEntity):
             "state": state_str,
             "value": state,
         }
-        return json.dumps(data)
+        return data
+
+    async def handle_web_command(self, action, params):
+        if action == "turn_on":
+            await self.set_state(True)
+        elif action == "turn_off":
+            await self.set_state(False)
+        elif action == "toggle":
+            await self.set_state(not await self.get_state())
+        else:
+            await super().handle_web_command(action, params)
 
     async def add_routes(self, router):
         router.add_route("GET", f"/switch/{self.object_id}", self.route_get_state)
         router.add_route("POST", f"/switch/{self.object_id}/turn_on", self.route_turn_on)
         router.add_route("POST", f"/switch/{self.object_id}/turn_off", self.route_turn_off)
 
-    async def route_get_state(self, request):
-        data = await self.state_json()
-        return web.Response(text=data)
-
     async def route_turn_off(self, request):
         await self.set_state(False)
         data = await self.state_json()
@@ -1,59 +1,357 @@
 import asyncio
+import json
+import logging
 import os
+import re
 
-from aiohttp import web
+from collections import deque
+
+from aiohttp import web, WSMsgType
 from aiohttp_sse import sse_response
 
 from . import BasicEntity
+from .framing import encode_plaintext_frames, message_to_packet
+from .logger import LOG_LEVEL_VERY_VERBOSE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_BUFFER_SIZE = 256
+DEFAULT_PING_INTERVAL = 1.0
+DEFAULT_WS_FLUSH_INTERVAL = 0.05
+
+_LINE_SEP = re.compile(r"\r\n|\r|\n")
+
+def format_sse(event, data):
+    lines = [f"event: {event}"]
+    lines.extend(f"data: {chunk}" for chunk in _LINE_SEP.split(data))
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+class EventSubscriber:
+    def __init__(self, buffer_size):
+        self.events = deque(maxlen=buffer_size)
+        self.states = {}
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, payload):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append(payload)
+        self.ready.set()
+
+    def put_state(self, key, payload):
+        # Only the latest state per entity is kept, so states are never dropped
+        self.states[key] = payload
+        self.ready.set()
+
+    async def get(self, timeout):
+        if not self.events and not self.states:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.states:
+            # Every pending state goes out in one write
+            payload = b"".join(self.states.values())
+            self.states = {}
+            return payload
+        return self.events.popleft()
+
+class EventHub:
+    """Fans server-sent events out to every connected /events client.
+
+    Each event is encoded once and the same bytes are queued on every
+    subscriber's bounded ring buffer, so a slow browser only loses its own
+    oldest events and nothing is buffered while nobody is connected. State
+    events are coalesced per entity instead, so a big batch of state
+    changes costs one write per subscriber and none of them are lost.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.subscribers = set()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self):
+        subscriber = EventSubscriber(self.buffer_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        if not self.subscribers:
+            return
+
+        payload = format_sse(event, data)
+        for subscriber in self.subscribers:
+            subscriber.put(payload)
+
+    def publish_state(self, key, data):
+        if not self.subscribers:
+            return
+
+        payload = format_sse("state", data)
+        for subscriber in self.subscribers:
+            subscriber.put_state(key, payload)
+
+class WebSocketClient:
+    def __init__(self, ws, binary, flush_interval):
+        self.ws = ws
+        self.binary = binary
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def queue_state(self, message):
+        # Only the latest state per entity is sent in the next batch
+        self.pending[message.key] = message
+        self.ready.set()
 
 class WebServer(BasicEntity):
-    def __init__(self, *args, port=8080, **kwargs):
+    def __init__(
+            self,
+            *args,
+            port=8080,
+            event_buffer_size=DEFAULT_EVENT_BUFFER_SIZE,
+            ping_interval=DEFAULT_PING_INTERVAL,
+            ws_flush_interval=DEFAULT_WS_FLUSH_INTERVAL,
+            **kwargs
+    ):
         super().__init__(*args, **kwargs)
         self.port = port
-        self.queue = asyncio.Queue()
+        self.hub = EventHub(event_buffer_size)
+        self.ping_interval = ping_interval
+        self.ws_flush_interval = ws_flush_interval
+        self._ws_clients = set()
 
     async def index(self, _request):
         return web.FileResponse(
             path=os.path.dirname(__file__) + '/index.html'
         )
 
+    def subscriptions(self):
+        return [
+            ('state_change', None, None),
+            ('state_changes', None, None),
+            ('log', None, None),
+        ]
+
     async def handle(self, key, message):
         if key == "state_change":
-            key = message.key
-            entity = self.device.get_entity_by_key(key)
-            data = await entity.state_json()
-            await self.queue.put(("state", data))
+            await self.publish_state(message)
+
+        if key == "state_changes":
+            for state in message:
+                await self.publish_state(state)
+
+        if key == "log" and self.hub:
+            self.hub.publish("log", message[1])
 
-        if key == "log":
-            await self.queue.put(("log", message))
+    async def publish_state(self, message):
+        for client in self._ws_clients:
+            client.queue_state(message)
+
+        if self.hub:
+            entity = self.device.get_entity_by_key(message.key)
+            data = await entity.state_json()
+            if data is not None:
+                self.hub.publish_state(message.key, data)
 
     async def events(self, request):
+        subscriber = self.hub.subscribe()
+        self.device.set_log_subscription(self, LOG_LEVEL_VERY_VERBOSE)
+        try:
+            return await self._stream_events(request, subscriber)
+        finally:
+            self.hub.unsubscribe(subscriber)
+            if not self.hub:
+                self.device.set_log_subscription(self, None)
+
+    async def _stream_events(self, request, subscriber):
         async with sse_response(request) as resp:
-            for entity in self.device.entities:
-                data = await entity.state_json()
-                if data != None:
-                    await resp.send(data, event="state")
+            for data in await self.device.state_snapshot.build_json():
+                await resp.send(data, event="state")
 
+            ping = format_sse("ping", "")
             while resp.is_connected():
-                event, data = await self.queue.get()
-                if event == "log":
-                    data = data[1]
-
+                payload = await subscriber.get(self.ping_interval)
                 try:
-                    await resp.send(data, event=event)
+                    await resp.write(ping if payload is None else payload)
                 except ConnectionResetError:
                     break
 
         return resp
 
-    async def run(self):
+    def get_entity_by_json_id(self, json_id):
+        domain, _, object_id = json_id.partition("-")
+        entity = self.device.get_entity(object_id)
+        if entity is None or entity.DOMAIN != domain:
+            return None
+        return entity
+
+    async def run_web_commands(self, commands):
+        async with self.device.batch_state_changes():
+            return await self._run_web_commands(commands)
+
+    async def _run_web_commands(self, commands):
+        results = []
+        for command in commands:
+            if not isinstance(command, dict):
+                results.append({"id": None, "ok": False, "error": "command must be an object"})
+                continue
+
+            entity_id = command.get("id", "")
+            entity = self.get_entity_by_json_id(entity_id) if isinstance(entity_id, str) else None
+            if entity is None:
+                results.append({"id": entity_id, "ok": False, "error": "unknown entity"})
+                continue
+
+            params = command.get("params") or {}
+            if not isinstance(params, dict):
+                results.append({"id": entity_id, "ok": False, "error": "params must be an object"})
+                continue
+
+            try:
+                await entity.handle_web_command(command.get("action"), params)
+                results.append({"id": entity_id, "ok": True})
+            except (ValueError, KeyError, TypeError) as e:
+                results.append({"id": entity_id, "ok": False, "error": str(e)})
+        return results
+
+    async def _send_ws_states(self, client, messages):
+        if client.binary:
+            await client.ws.send_bytes(
+                encode_plaintext_frames(message_to_packet(m) for m in messages)
+            )
+            return
+
+        states = []
+        for message in messages:
+            entity = self.device.get_entity_by_key(message.key)
+            data = None if entity is None else await entity.state_json()
+            if data is not None:
+                states.append(data)
+
+        if states:
+            await client.ws.send_str('{"type": "states", "states": [' + ", ".join(states) + ']}')
+
+    async def _flush_ws(self, client):
+        while not client.ws.closed:
+            await client.ready.wait()
+            await asyncio.sleep(client.flush_interval)
+            client.ready.clear()
+
+            messages = list(client.pending.values())
+            client.pending.clear()
+            try:
+                await self._send_ws_states(client, messages)
+            except ConnectionResetError:
+                break
+
+    async def websocket(self, request):
+        binary = request.query.get("format") == "binary"
+        flush_interval = self.ws_flush_interval
+        if "interval" in request.query:
+            try:
+                flush_interval = max(0.0, float(request.query["interval"]) / 1000.0)
+            except ValueError:
+                raise web.HTTPBadRequest(text="interval must be a number of milliseconds")
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        # Registered before the snapshot, so changes published while it is
+        # being sent are queued for the first flush rather than missed
+        client = WebSocketClient(ws, binary, flush_interval)
+        self._ws_clients.add(client)
+        flush_task = None
+        try:
+            if binary:
+                _packets, frame = await self.device.state_snapshot.build_packets()
+                await ws.send_bytes(frame)
+            else:
+                states = await self.device.state_snapshot.build_json()
+                await ws.send_str('{"type": "states", "states": [' + ", ".join(states) + ']}')
+
+            flush_task = asyncio.create_task(self._flush_ws(client))
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+
+                try:
+                    payload = json.loads(msg.data)
+                except ValueError:
+                    await ws.send_json({"type": "error", "error": "invalid json"})
+                    continue
+
+                commands = payload.get("commands", [payload]) if isinstance(payload, dict) else payload
+                if not isinstance(commands, list):
+                    await ws.send_json({"type": "error", "error": "commands must be a list"})
+                    continue
+                results = await self.run_web_commands(commands)
+                await ws.send_json({"type": "results", "results": results})
+        except ConnectionResetError:
+            logger.warning("Connection reset on websocket.")
+        finally:
+            self._ws_clients.discard(client)
+            if flush_task is not None:
+                flush_task.cancel()
+
+        return ws
+
+    async def route_get_states(self, request):
+        entities = self.device.entities
+        if "object_id" in request.query:
+            entities = [
+                self.device.get_entity(object_id)
+                for object_id in request.query["object_id"].split(",")
+            ]
+            entities = [e for e in entities if e is not None]
+        if "domain" in request.query:
+            domains = request.query["domain"].split(",")
+            if "object_id" in request.query:
+                entities = [e for e in entities if e.DOMAIN in domains]
+            else:
+                entities = [e for d in domains for e in self.device.get_entities_by_domain(d)]
+
+        states = await self.device.state_snapshot.build_json(entities)
+        return web.Response(text="[" + ", ".join(states) + "]", content_type="application/json")
+
+    async def route_post_commands(self, request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="invalid json")
+
+        commands = payload.get("commands", []) if isinstance(payload, dict) else payload
+        if not isinstance(commands, list):
+            raise web.HTTPBadRequest(text="commands must be a list")
+        results = await self.run_web_commands(commands)
+        return web.json_response(results)
+
+    async def build_app(self):
         app = web.Application()
+        app.router.add_route("GET", "/states", self.route_get_states)
+        app.router.add_route("POST", "/commands", self.route_post_commands)
         app.router.add_route("GET", "/events", self.events)
+        app.router.add_route("GET", "/ws", self.websocket)
         app.router.add_route("GET", "/", self.index)
 
         for entity in self.device.entities:
             await entity.add_routes(app.router)
-        
+        return app
+
+    async def run(self):
+        if self.port is None:
+            # Mounted into a shared application by a DeviceHost
+            return
+
+        app = await self.build_app()
         runner = web.AppRunner(app)
         await runner.setup()
         site = web.TCPSite(runner, '0.0.0.0', self.port)
@@ -62,5 +360,4 @@ class WebServer(BasicEntity):
         await site.start()
 
         while True:
-            await asyncio.sleep(1)
-            await self.queue.put(("ping", ""))
+            await asyncio.sleep(3600)
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import os
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, DeviceHost, SensorEntity, SwitchEntity
+
+DEFAULT_DEVICE_COUNT = 200
+SENSORS_PER_DEVICE = 5
+WEB_PORT = 18080
+API_PORT_START = 16053
+MEASURE_SECONDS = 10
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def build_device(i):
+    device = Device(name=f"Scale Node {i}", log_level=0)
+    for j in range(SENSORS_PER_DEVICE):
+        device.add_entity(SensorEntity(name=f"Sensor {j}"))
+    device.add_entity(SwitchEntity(name="Relay"))
+    return device
+
+async def poll(devices):
+    # Every sensor on every device changes once a second
+    value = 0.0
+    while True:
+        value += 1
+        for device in devices:
+            sensors = list(device.get_entities_by_domain("sensor"))
+            await device.update_sensors([s.key for s in sensors], [value] * len(sensors))
+        await asyncio.sleep(1)
+
+async def main(device_count=DEFAULT_DEVICE_COUNT):
+    rss_start = rss_bytes()
+
+    host = DeviceHost(web_port=WEB_PORT, api_port_start=API_PORT_START)
+    devices = [host.add_device(build_device(i)) for i in range(device_count)]
+    host_task = asyncio.create_task(host.run())
+
+    while not all(d.api_server.server for d in devices):
+        await asyncio.sleep(0.1)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{WEB_PORT}/") as resp:
+            listed = await resp.json()
+        prefix = listed[-1]["path"]
+        async with session.get(f"http://127.0.0.1:{WEB_PORT}{prefix}states") as resp:
+            states = await resp.json()
+
+    rss_running = rss_bytes()
+
+    poll_task = asyncio.create_task(poll(devices))
+    cpu_start = time.process_time()
+    await asyncio.sleep(MEASURE_SECONDS)
+    cpu = time.process_time() - cpu_start
+    poll_task.cancel()
+
+    print(f"{device_count} devices, {len(listed)} listed, {len(states)} states on {prefix}")
+    print(f"memory: {(rss_running - rss_start) / 1024 / 1024:.1f} MiB total, {(rss_running - rss_start) / device_count / 1024:.1f} KiB/device")
+    print(f"cpu: {cpu / MEASURE_SECONDS * 100:.1f}% total, {cpu / MEASURE_SECONDS / device_count * 1e6:.1f} us/s per device")
+
+    host_task.cancel()
+    try:
+        await host_task
+    except asyncio.CancelledError:
+        pass
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DEVICE_COUNT))
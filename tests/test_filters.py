@@ -0,0 +1,150 @@
+import asyncio
+import math
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import (
+    DebounceFilter,
+    DelayedOnFilter,
+    DelayedOnOffFilter,
+    DeltaFilter,
+    ExponentialMovingAverageFilter,
+    FilterChain,
+    OrFilter,
+    SlidingWindowMovingAverageFilter,
+    ThrottleFilter,
+)
+
+DELAY = 0.05
+
+def run(f, values):
+    return [f.new_value(v) for v in values]
+
+def same(a, b):
+    return all(x == y or (x is not None and y is not None and math.isnan(x) and math.isnan(y)) for x, y in zip(a, b)) and len(a) == len(b)
+
+def check_sliding_window():
+    # send_first_at=1 sends the first value, then every send_every values
+    f = SlidingWindowMovingAverageFilter(window_size=3, send_every=2, send_first_at=1)
+    assert run(f, [1, 2, 3, 4, 5]) == [1, None, 2, None, 4]
+
+    f = SlidingWindowMovingAverageFilter(window_size=3, send_every=3, send_first_at=3)
+    assert run(f, [3, 6, 9, 12]) == [None, None, 6, None]
+
+    # The ring buffer wraps, dropping the oldest value from the sum
+    f = SlidingWindowMovingAverageFilter(window_size=2, send_every=1)
+    assert run(f, [1, 2, 3, 4, 5]) == [1, 1.5, 2.5, 3.5, 4.5]
+
+    # NaN is skipped rather than poisoning the average
+    f = SlidingWindowMovingAverageFilter(window_size=2, send_every=1)
+    assert run(f, [1, math.nan, 3, math.nan, 5]) == [1, 1, 2, 2, 4]
+
+    f = SlidingWindowMovingAverageFilter(window_size=2, send_every=1)
+    assert same(run(f, [math.nan, 2]), [math.nan, 2])
+
+    # Wrapping many times doesn't accumulate rounding error
+    f = SlidingWindowMovingAverageFilter(window_size=10, send_every=1)
+    for i in range(100_000):
+        out = f.new_value(0.1 * (i % 7))
+    assert abs(out - math.fsum(0.1 * (i % 7) for i in range(99_990, 100_000)) / 10) < 1e-12
+
+    try:
+        SlidingWindowMovingAverageFilter(window_size=0)
+        raise AssertionError("window_size=0 accepted")
+    except ValueError:
+        pass
+
+def check_exponential_average():
+    f = ExponentialMovingAverageFilter(alpha=0.5, send_every=1)
+    assert run(f, [2, 4, math.nan, 8]) == [2, 3, 3, 5.5]
+
+    f = ExponentialMovingAverageFilter(alpha=0.5, send_every=2, send_first_at=2)
+    assert run(f, [2, 4, 6, 8]) == [None, 3, None, 6.25]
+
+    f = ExponentialMovingAverageFilter(send_every=1)
+    assert same(run(f, [math.nan]), [math.nan])
+
+def check_delta():
+    f = DeltaFilter(1)
+    assert run(f, [10, 10.5, 11, 10.2, 9.9]) == [10, None, 11, None, 9.9]
+
+    # Percentage of the last passed value
+    f = DeltaFilter(10, percentage=True)
+    assert run(f, [100, 105, 109.9, 111, 100, 99]) == [100, None, None, 111, None, 99]
+
+    # After NaN the next real value always passes
+    f = DeltaFilter(5)
+    assert same(run(f, [math.nan, 1, 2]), [math.nan, 1, None])
+
+def check_throttle():
+    f = ThrottleFilter(60)
+    assert run(f, [1, 2, 3]) == [1, None, None]
+
+def collecting_chain(filters):
+    published = []
+    async def publish(value):
+        published.append(value)
+    return FilterChain(filters, publish), published
+
+async def check_debounce():
+    chain, published = collecting_chain([DebounceFilter(DELAY)])
+    assert chain.push(1) is None
+    assert chain.push(2) is None
+    await asyncio.sleep(DELAY * 3)
+    assert published == [2], published
+
+    # Filters after a timer filter still see the emitted value
+    chain, published = collecting_chain([DebounceFilter(DELAY), DeltaFilter(5)])
+    chain.push(1)
+    await asyncio.sleep(DELAY * 3)
+    chain.push(2)
+    await asyncio.sleep(DELAY * 3)
+    assert published == [1], published
+
+async def check_or_filter():
+    chain, published = collecting_chain([OrFilter(ThrottleFilter(60), DebounceFilter(DELAY))])
+    # The throttle passes the first value straight away
+    assert chain.push(1) == 1
+    # Later values are held by the throttle but come out of the debounce
+    assert chain.push(2) is None
+    await asyncio.sleep(DELAY * 3)
+    assert published == [2], published
+
+    # Cancelling the chain reaches the timer inside the OrFilter
+    chain.push(3)
+    chain.cancel()
+    await asyncio.sleep(DELAY * 3)
+    assert published == [2], published
+
+async def check_delayed_on_off():
+    chain, published = collecting_chain([DelayedOnOffFilter(on_delay=DELAY, off_delay=0)])
+    assert chain.push(True) is None
+    # Going off before the on delay passes cancels the pending on
+    assert chain.push(False) is False
+    await asyncio.sleep(DELAY * 3)
+    assert published == [], published
+
+    assert chain.push(True) is None
+    await asyncio.sleep(DELAY * 3)
+    assert published == [True], published
+
+    chain, published = collecting_chain([DelayedOnFilter(DELAY)])
+    chain.push(True)
+    chain.cancel()
+    await asyncio.sleep(DELAY * 3)
+    assert published == [], published
+
+async def main():
+    check_sliding_window()
+    check_exponential_average()
+    check_delta()
+    check_throttle()
+    await check_debounce()
+    await check_or_filter()
+    await check_delayed_on_off()
+    print("filters ok")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import HelloRequest, PingRequest, SwitchCommandRequest
+from aioesphomeserver.framing import (
+    MAX_FRAME_SIZE,
+    FrameDecoder,
+    ProtocolError,
+    encode_plaintext_frame,
+    message_to_packet,
+    varuint_to_bytes,
+)
+
+def frame(msg):
+    return encode_plaintext_frame(*message_to_packet(msg))
+
+def raises(data):
+    try:
+        FrameDecoder().feed(data)
+    except ProtocolError as e:
+        return str(e)
+    raise AssertionError(f"no ProtocolError for {data[:16]!r}")
+
+def check_whole_frames():
+    hello = HelloRequest(client_info="test", api_version_major=1, api_version_minor=9)
+    command = SwitchCommandRequest(key=3, state=True)
+    messages = FrameDecoder().feed(frame(hello) + frame(PingRequest()) + frame(command))
+    assert messages == [hello, PingRequest(), command], messages
+
+def check_split_frames():
+    hello = HelloRequest(client_info="x" * 300)
+    command = SwitchCommandRequest(key=7, state=True)
+    data = frame(hello) + frame(command)
+
+    # One byte at a time, including through the two byte length varint
+    decoder = FrameDecoder()
+    messages = []
+    for i in range(len(data)):
+        messages += decoder.feed(data[i:i + 1])
+    assert messages == [hello, command], messages
+
+    # Every split point of a two frame stream
+    for split in range(len(data) + 1):
+        decoder = FrameDecoder()
+        messages = decoder.feed(data[:split]) + decoder.feed(data[split:])
+        assert messages == [hello, command], split
+
+def check_unknown_type_skipped():
+    data = encode_plaintext_frame(0x3fff, b"ignored") + frame(PingRequest())
+    assert FrameDecoder().feed(data) == [PingRequest()]
+
+def check_truncated_varints():
+    # A length varint still missing its last byte waits for more data
+    decoder = FrameDecoder()
+    assert decoder.feed(b"\0\x80\x80") == []
+    assert decoder.feed(b"\x00") == []
+    assert decoder.feed(b"\x07") == [PingRequest()]
+
+    # One that never terminates is garbage
+    assert "length" in raises(b"\0" + b"\xff" * 11)
+    assert "type" in raises(b"\0\x01" + b"\xff" * 11)
+
+def check_oversized_frame():
+    assert "exceeds" in raises(b"\0" + varuint_to_bytes(MAX_FRAME_SIZE + 1) + b"\x07")
+    # At the limit the decoder just waits for the rest of the frame
+    assert FrameDecoder().feed(b"\0" + varuint_to_bytes(MAX_FRAME_SIZE) + b"\x07") == []
+
+def check_bad_preamble():
+    assert "preamble" in raises(b"\x01\x00\x07")
+    # Also after a good frame in the same read
+    assert "preamble" in raises(frame(PingRequest()) + b"\x01\x00\x07")
+
+def check_undecodable_message():
+    assert "HelloRequest" in raises(encode_plaintext_frame(1, b"\xff\xff\xff"))
+
+def main():
+    check_whole_frames()
+    check_split_frames()
+    check_unknown_type_skipped()
+    check_truncated_varints()
+    check_oversized_frame()
+    check_bad_preamble()
+    check_undecodable_message()
+    print("framing ok")
+
+if __name__ == "__main__":
+    main()
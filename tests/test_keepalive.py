@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import (
+    ConnectRequest,
+    Device,
+    HelloRequest,
+    NativeApiServer,
+    PingRequest,
+    PingResponse,
+)
+from aioesphomeserver.framing import FrameDecoder, encode_plaintext_frame, message_to_packet
+from aioesphomeserver.scheduler import get_scheduler
+
+API_PORT = 16053
+IDLE_CONNECTIONS = 1000
+
+def frame(msg):
+    return encode_plaintext_frame(*message_to_packet(msg))
+
+async def connect():
+    reader, writer = await asyncio.open_connection("127.0.0.1", API_PORT)
+    writer.write(frame(HelloRequest(client_info="keepalive")) + frame(ConnectRequest()))
+    return reader, writer
+
+async def silent_client():
+    # Never answers pings, the server should drop it after interval + timeout
+    reader, writer = await connect()
+    start = time.perf_counter()
+    while await reader.read(65536):
+        pass
+    return time.perf_counter() - start
+
+async def responsive_client(duration):
+    reader, writer = await connect()
+    decoder = FrameDecoder()
+    pings = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            data = await asyncio.wait_for(reader.read(65536), deadline - time.perf_counter())
+        except asyncio.TimeoutError:
+            break
+        if not data:
+            return pings, False
+        for msg in decoder.feed(data):
+            if isinstance(msg, PingRequest):
+                pings += 1
+                writer.write(frame(PingResponse()))
+    writer.close()
+    return pings, True
+
+async def main():
+    device = Device(name="Keepalive Test", log_level=0)
+    server = NativeApiServer(name="_server", port=API_PORT, keepalive_interval=0.5, keepalive_timeout=0.5)
+    device.add_entity(server)
+    server_task = asyncio.create_task(server.run())
+    while server.server is None:
+        await asyncio.sleep(0.05)
+
+    closed_after, (pings, alive) = await asyncio.gather(silent_client(), responsive_client(3))
+    print(f"silent client closed after {closed_after:.2f}s")
+    print(f"responsive client answered {pings} pings, still connected: {alive}")
+
+    idle = [await connect() for _ in range(IDLE_CONNECTIONS)]
+    await asyncio.sleep(0.2)
+    print(f"{server.client_count} idle connections: {len(asyncio.all_tasks())} tasks, {len(get_scheduler())} timers")
+
+    for _reader, writer in idle:
+        writer.close()
+    while server.client_count:
+        await asyncio.sleep(0.05)
+    server_task.cancel()
+    try:
+        await server_task
+    except asyncio.CancelledError:
+        pass
+
+if __name__ == "__main__":
+    asyncio.run(main())
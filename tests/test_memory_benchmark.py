@@ -0,0 +1,55 @@
+import asyncio
+import sys
+import os
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, SensorEntity, SwitchEntity, LightEntity
+
+ENTITY_COUNT = 10000
+
+class Plain:
+    pass
+
+def dict_based(entity_class):
+    # Shadowing every slot with a plain class attribute sends the attributes
+    # to the instance __dict__, the layout entities had before __slots__.
+    slots = {name for klass in entity_class.__mro__ for name in getattr(klass, "__slots__", ())}
+    shadow = type(f"Dict{entity_class.__name__}", (entity_class,), {name: None for name in slots})
+    # The shadowed slots still take space in every instance, which the
+    # dict-based entities never had
+    unused_slots = sys.getsizeof(shadow.__new__(shadow)) - sys.getsizeof(Plain())
+    return shadow, unused_slots
+
+async def populate(device):
+    for entity in device.get_entities_by_domain("sensor"):
+        await entity.set_state(entity.key * 0.5)
+
+def measure(label, entity_class, unused_bytes=0, **device_kwargs):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    device = Device(name="Memory Benchmark", log_level=0, **device_kwargs)
+    for i in range(ENTITY_COUNT):
+        device.add_entity(entity_class(name=f"Entity {i}"))
+    # Every sensor holds a distinct value, as it would once readings arrive
+    asyncio.run(populate(device))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    total = after - before - unused_bytes * ENTITY_COUNT
+    print(f"{label:<36} {total / 1024 / 1024:>8.2f} MiB {total / ENTITY_COUNT:>8.0f} B/entity")
+    return device
+
+def main():
+    print(f"{ENTITY_COUNT} entities per device, sensors populated")
+    for entity_class in (SensorEntity, SwitchEntity, LightEntity):
+        shadow, unused = dict_based(entity_class)
+        measure(f"{entity_class.__name__} (dict-based baseline)", shadow, unused)
+        measure(f"{entity_class.__name__}", entity_class)
+
+    device = measure("SensorEntity (columnar)", SensorEntity, columnar_sensors=True)
+    print(f"columnar store holds {len(device.sensor_store)} values")
+
+if __name__ == "__main__":
+    main()
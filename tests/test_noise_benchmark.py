@@ -0,0 +1,142 @@
+import asyncio
+import base64
+import sys
+import os
+import time
+
+from aioesphomeapi import APIClient, InvalidEncryptionKeyAPIError, RequiresEncryptionAPIError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, SensorEntity, SensorStateResponse, SwitchEntity
+from aioesphomeserver.encryption import NoiseFrameHelper
+from aioesphomeserver.framing import PlaintextFrameHelper, message_to_packet
+
+API_PORT = 16053
+SENSORS = 100
+ROUNDS = 200
+ENCODE_PACKETS = 100_000
+KEY = base64.b64encode(bytes(range(32))).decode()
+WRONG_KEY = base64.b64encode(bytes(32)).decode()
+
+def build_device(encryption_key):
+    device = Device(name="Noise Benchmark", log_level=0, encryption_key=encryption_key)
+    device.add_entity(SwitchEntity(name="Relay"))
+    for i in range(SENSORS):
+        device.add_entity(SensorEntity(name=f"Sensor {i}"))
+    return device
+
+def sensor_keys(device):
+    return [device.get_entity(f"sensor_{i}").key for i in range(SENSORS)]
+
+async def start(device):
+    task = asyncio.create_task(device.run(API_PORT, None))
+    while device.api_server is None or device.api_server.server is None:
+        await asyncio.sleep(0.05)
+    return task
+
+async def stop(device, task):
+    while device.api_server.client_count:
+        await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+async def check_client():
+    device = build_device(KEY)
+    task = await start(device)
+
+    client = APIClient("127.0.0.1", API_PORT, None, noise_psk=KEY)
+    await client.connect(login=True)
+    info = await client.device_info()
+    entities, _services = await client.list_entities_services()
+
+    relay = next(e for e in entities if e.object_id == "relay")
+    toggled = asyncio.get_running_loop().create_future()
+    def on_state(state):
+        if state.key == relay.key and state.state and not toggled.done():
+            toggled.set_result(state)
+    client.subscribe_states(on_state)
+    client.switch_command(relay.key, True)
+    await asyncio.wait_for(toggled, 5)
+    await client.disconnect()
+    print(f"encrypted client: {info.name}, {len(entities)} entities, switch command round trip ok")
+
+    for name, bad_client, expected in (
+        ("wrong key", APIClient("127.0.0.1", API_PORT, None, noise_psk=WRONG_KEY), InvalidEncryptionKeyAPIError),
+        ("plaintext client", APIClient("127.0.0.1", API_PORT, None), RequiresEncryptionAPIError),
+    ):
+        try:
+            await bad_client.connect(login=True)
+            print(f"{name}: unexpectedly connected")
+        except expected:
+            print(f"{name}: rejected with {expected.__name__}")
+
+    await stop(device, task)
+
+async def throughput(encryption_key):
+    device = build_device(encryption_key)
+    task = await start(device)
+
+    client = APIClient("127.0.0.1", API_PORT, None, noise_psk=encryption_key)
+    await client.connect(login=True)
+    entities, _services = await client.list_entities_services()
+    keys = sensor_keys(device)
+    watched = set(keys)
+
+    expected = SENSORS * ROUNDS
+    received = 0
+    done = asyncio.get_running_loop().create_future()
+    def on_state(state):
+        nonlocal received
+        if state.key in watched and state.state >= 1:
+            received += 1
+            if received == expected and not done.done():
+                done.set_result(None)
+    client.subscribe_states(on_state)
+    await asyncio.sleep(0.2)
+
+    start_time = time.perf_counter()
+    for i in range(ROUNDS):
+        await device.update_sensors(keys, [i + 1.0] * SENSORS)
+        await asyncio.sleep(0)
+    await asyncio.wait_for(done, 30)
+    elapsed = time.perf_counter() - start_time
+
+    await client.disconnect()
+    await stop(device, task)
+    return expected / elapsed
+
+def encode_rate(helper):
+    packets = [message_to_packet(SensorStateResponse(key=i % SENSORS, state=i)) for i in range(ENCODE_PACKETS)]
+    start_time = time.perf_counter()
+    size = 0
+    for i in range(0, ENCODE_PACKETS, SENSORS):
+        size += sum(map(len, helper.encode_frames(packets[i:i + SENSORS])))
+    elapsed = time.perf_counter() - start_time
+    return ENCODE_PACKETS / elapsed, size / elapsed / 1e6
+
+def ready_noise_helper():
+    # A helper past its handshake, for timing encode_frames on its own
+    from chacha20poly1305_reuseable import ChaCha20Poly1305Reusable
+    helper = NoiseFrameHelper(bytes(32), "bench", lambda frame: None)
+    helper._encrypt = ChaCha20Poly1305Reusable(bytes(32)).encrypt
+    helper._state = 3
+    return helper
+
+async def main():
+    await check_client()
+
+    print(f"\n{'framing':<10} {'encode frames/s':>16} {'encode MB/s':>12} {'end to end states/s':>20}")
+    for name, helper, key in (
+        ("plaintext", PlaintextFrameHelper(), None),
+        ("noise", ready_noise_helper(), KEY),
+    ):
+        frames, mbytes = encode_rate(helper)
+        states = await throughput(key)
+        print(f"{name:<10} {frames:>16,.0f} {mbytes:>12.1f} {states:>20,.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
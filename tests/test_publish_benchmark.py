@@ -0,0 +1,51 @@
+import asyncio
+import contextlib
+import io
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, SwitchEntity, EntityListener, SwitchCommandRequest
+
+ITERATIONS = 2000
+
+class CountingListener(EntityListener):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = 0
+
+    async def handle(self, key, message):
+        self.count += 1
+
+def build_device(entity_count):
+    device = Device(name=f"Benchmark {entity_count}")
+    for i in range(entity_count):
+        device.add_entity(SwitchEntity(name=f"Switch {i}"))
+
+    listener = CountingListener(name="_listener", entity_id="switch_0")
+    device.add_entity(listener)
+    return device, listener
+
+async def bench(coro_fn, *args):
+    # Device.log prints every line, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            await coro_fn(*args)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+async def main():
+    print(f"{'entities':>10} {'command us':>12} {'log us':>10}")
+    for entity_count in (10, 100, 1000, 10000):
+        device, listener = build_device(entity_count)
+        target = device.get_entity("switch_0")
+        command = SwitchCommandRequest(key=target.key, state=True)
+        command_us = await bench(device.route_command, None, command)
+        log_us = await bench(device.publish, None, 'log', (3, "benchmark"))
+
+        print(f"{entity_count:>10} {command_us:>12.2f} {log_us:>10.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
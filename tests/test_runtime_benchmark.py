@@ -0,0 +1,82 @@
+import asyncio
+import statistics
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import (
+    ConnectRequest,
+    Device,
+    DEFAULT_RUNTIME_PROFILE,
+    HelloRequest,
+    LOW_LATENCY_RUNTIME_PROFILE,
+    RuntimeProfile,
+    SubscribeStatesRequest,
+    SwitchCommandRequest,
+    SwitchEntity,
+    SwitchStateResponse,
+)
+from aioesphomeserver.framing import FrameDecoder, encode_plaintext_frame, message_to_packet
+
+API_PORT = 16053
+ITERATIONS = 2000
+
+PROFILES = {
+    "default": DEFAULT_RUNTIME_PROFILE,
+    "eager tasks": RuntimeProfile(eager_tasks=True),
+    "low latency": LOW_LATENCY_RUNTIME_PROFILE,
+}
+
+def frame(msg):
+    return encode_plaintext_frame(*message_to_packet(msg))
+
+async def read_until(reader, decoder, predicate):
+    while True:
+        for msg in decoder.feed(await reader.read(65536)):
+            if predicate(msg):
+                return msg
+
+async def bench(profile):
+    device = Device(name="Runtime Benchmark", log_level=0)
+    switch = SwitchEntity(name="Relay")
+    device.add_entity(switch)
+    run_task = asyncio.create_task(device.run(API_PORT, None, runtime_profile=profile))
+
+    while device.api_server is None or device.api_server.server is None:
+        await asyncio.sleep(0.05)
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", API_PORT)
+    decoder = FrameDecoder()
+    writer.write(frame(HelloRequest(client_info="bench")) + frame(ConnectRequest()) + frame(SubscribeStatesRequest()))
+    await read_until(reader, decoder, lambda m: isinstance(m, SwitchStateResponse))
+
+    # Command -> state response round trips through the whole server
+    latencies = []
+    for i in range(ITERATIONS):
+        state = i % 2 == 0
+        start = time.perf_counter()
+        writer.write(frame(SwitchCommandRequest(key=switch.key, state=state)))
+        await read_until(reader, decoder, lambda m: isinstance(m, SwitchStateResponse) and m.state == state)
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    writer.close()
+    run_task.cancel()
+    try:
+        await run_task
+    except asyncio.CancelledError:
+        pass
+
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+def main():
+    print(f"{'profile':<14} {'loop':<10} {'p50 us':>8} {'p99 us':>8}")
+    for name, profile in PROFILES.items():
+        loop = "uvloop" if profile.loop_factory() else "asyncio"
+        p50, p99 = profile.run(bench(profile))
+        print(f"{name:<14} {loop:<10} {p50:>8.1f} {p99:>8.1f}")
+
+if __name__ == "__main__":
+    main()
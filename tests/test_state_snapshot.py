@@ -0,0 +1,54 @@
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, NativeApiServer, SensorEntity, SwitchEntity
+from aioesphomeserver.framing import FrameDecoder
+
+class RecordingClient:
+    def __init__(self):
+        self.states = {}
+
+    async def write_packets(self, packets, plaintext_frame=None):
+        decoder = FrameDecoder()
+        for message in decoder.feed(plaintext_frame):
+            self.states[message.key] = message.state
+
+async def sent_states(device):
+    server = NativeApiServer(name="_api")
+    server.device = device
+    client = RecordingClient()
+    await server.send_all_states(client)
+    return client.states
+
+async def main():
+    device = Device(name="Snapshot Test", log_level=0)
+    relay = SwitchEntity(name="Relay")
+    device.add_entity(relay)
+    device.add_entity(SensorEntity(name="Temperature"))
+    await relay.set_state(True)
+
+    states = await sent_states(device)
+    assert len(states) == 2, states
+
+    # Entities added and replaced after the snapshot loaded
+    pressure = SensorEntity(name="Pressure")
+    device.add_entity(pressure)
+    await pressure.set_state(1013.0)
+    device.replace_entity(relay, SwitchEntity(name="Relay 2"))
+
+    states = await sent_states(device)
+    assert len(states) == 3, states
+    assert states[pressure.key] == 1013.0, states
+    assert states[relay.key] is False, states
+
+    humidity = SensorEntity(name="Humidity")
+    device.add_entity(humidity)
+    states = await sent_states(device)
+    assert humidity.key in states, states
+    print("send_all_states covers entities added at runtime")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import json
+import sys
+import os
+
+import aiohttp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, Supervisor, SensorEntity, SwitchEntity, RemoteEntityListener
+
+DEVICE_COUNT = 8
+WORKERS = 4
+MANAGEMENT_PORT = 18000
+WEB_PORT_START = 18080
+API_PORT_START = 16053
+
+class ToggleSwitch(SwitchEntity):
+    async def run(self):
+        while True:
+            await asyncio.sleep(0.5)
+            await self.set_state(not await self.get_state())
+
+class MirrorListener(RemoteEntityListener):
+    # Counts the toggles seen on the remote switch in a local sensor
+    async def handle(self, key, message):
+        counter = self.device.get_entity("toggles")
+        await counter.set_state(await counter.get_state() + 1)
+
+def toggler():
+    device = Device(name=f"Node {DEVICE_COUNT - 1}", log_level=0)
+    device.add_entity(ToggleSwitch(name="Relay"))
+    return device
+
+def mirror():
+    device = Device(name="Node 0", log_level=0)
+    device.add_entity(SensorEntity(name="Toggles"))
+    device.add_entity(MirrorListener(name="_mirror", remote_device=f"Node {DEVICE_COUNT - 1}", entity_id="relay"))
+    return device
+
+def plain(i):
+    return Device(name=f"Node {i}", log_level=0)
+
+async def get_json(session, url):
+    async with session.get(url) as resp:
+        return json.loads(await resp.text())
+
+async def main():
+    supervisor = Supervisor(
+        # Factories are pickled into the workers, so no lambdas or closures
+        [mirror] + [functools.partial(plain, i) for i in range(1, DEVICE_COUNT - 1)] + [toggler],
+        workers=WORKERS,
+        api_port_start=API_PORT_START,
+        web_port_start=WEB_PORT_START,
+        management_port=MANAGEMENT_PORT,
+        metrics_interval=1,
+    )
+    task = asyncio.create_task(supervisor.run())
+    await asyncio.sleep(8)
+
+    async with aiohttp.ClientSession() as session:
+        devices = await get_json(session, f"http://127.0.0.1:{MANAGEMENT_PORT}/")
+        for device in devices:
+            print(f"{device['name']:<8} worker {device['worker']} pid {device['pid']} api {device['api_port']} web {device['web_port']}{device['path']}")
+
+        node0 = next(d for d in devices if d["name"] == "Node 0")
+        states = await get_json(session, f"http://127.0.0.1:{node0['web_port']}{node0['path']}states?object_id=toggles")
+        print(f"Node 0 saw {states[0]['state']} toggles from Node {DEVICE_COUNT - 1}")
+
+        metrics = await get_json(session, f"http://127.0.0.1:{MANAGEMENT_PORT}/metrics")
+        print(f"events routed: {metrics['events_routed']}")
+        for worker in metrics["workers"]:
+            print(f"worker {worker['index']} alive={worker['alive']} cpu={worker.get('cpu_seconds', 0):.2f}s devices={list(worker.get('devices', {}))}")
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+import io
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aioesphomeserver import Device, SensorEntity
+
+SENSOR_COUNT = 1000
+ROUNDS = 20
+
+def build_device(**kwargs):
+    device = Device(name="Update Benchmark", **kwargs)
+    for i in range(SENSOR_COUNT):
+        device.add_entity(SensorEntity(name=f"Register {i}"))
+    keys = [e.key for e in device.get_entities_by_domain("sensor")]
+    return device, keys
+
+def poll(round):
+    # Roughly a quarter of the registers change on every poll
+    return [float(i + round * (i % 4 == 0)) for i in range(SENSOR_COUNT)]
+
+async def bench(fn):
+    # Device.log prints every line, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for round in range(ROUNDS):
+            await fn(poll(round))
+    return (time.perf_counter() - start) / ROUNDS * 1e3
+
+async def main():
+    print(f"{SENSOR_COUNT} sensors, ms per poll")
+
+    device, keys = build_device()
+    sensors = list(device.get_entities_by_domain("sensor"))
+
+    async def per_value(values):
+        for entity, value in zip(sensors, values):
+            await entity.set_state(value)
+
+    print(f"{'set_state':<28} {await bench(per_value):>8.2f}")
+
+    device, keys = build_device()
+    print(f"{'update_sensors':<28} {await bench(lambda values: device.update_sensors(keys, values)):>8.2f}")
+
+    device, keys = build_device(columnar_sensors=True)
+    print(f"{'update_sensors (columnar)':<28} {await bench(lambda values: device.update_sensors(keys, values)):>8.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())